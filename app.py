@@ -4,12 +4,15 @@ import plotly.express as px
 import plotly.graph_objects as go
 import time
 import os
-import json
 
-from src.law_fetcher import fetch_law_summary
+from src.law_fetcher import stream_law_context, write_law_context
 from src.linker import link_comments_to_law
 from src.sentiment_engine import analyze_sentiment
-from src.insight_engine import get_groq_insight
+from src.insight_engine import (
+    get_groq_insight, collect_insight_tasks, insight_failed, insight_pairs, select_insight_comments, log_token_savings,
+)
+from src.insight_scheduler import generate_insights
+from src.warmup import start_warmup, warmup_status, record_request_latency
 
 # ─────────────────────────────────────────────────────────────────────────────
 # PAGE CONFIG
@@ -21,6 +24,10 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
+# Start loading MiniLM / RoBERTa in the background on the first script run,
+# so the first "Run Analysis" doesn't pay for it (no-op on later reruns)
+start_warmup()
+
 # ─────────────────────────────────────────────────────────────────────────────
 # GLOBAL CSS
 # ─────────────────────────────────────────────────────────────────────────────
@@ -517,7 +524,9 @@ h3 { animation: none !important; }
 # ─────────────────────────────────────────────────────────────────────────────
 
 @st.cache_data(show_spinner=False)
-def run_cached_analysis(law_name, file_bytes):
+def run_cached_analysis(law_name, file_bytes, _refresh_law=False):
+    # _refresh_law is left out of the memo key (leading underscore); the caller clears the memo to force a refetch
+    request_start = time.perf_counter()
     temp_path = os.path.join("data", "raw", "temp_upload.csv")
     os.makedirs(os.path.dirname(temp_path), exist_ok=True)
     with open(temp_path, "wb") as f:
@@ -527,16 +536,16 @@ def run_cached_analysis(law_name, file_bytes):
 
     status_text.markdown("### 🔍 1/4: Fetching Law Context (Groq Llama-3)...")
     progress_bar.progress(25)
-    law_data = fetch_law_summary(law_name)
+    # Clauses are embedded as they stream in while the comments encode alongside
+    comments = df['Comment'] if 'Comment' in df.columns else None
+    pack = stream_law_context(law_name, refresh=_refresh_law, comments=comments)
+    law_data = pack['clauses'] if pack is not None else []
 
-    law_context_path = os.path.join("data", "processed", "law_context.json")
-    os.makedirs(os.path.dirname(law_context_path), exist_ok=True)
-    with open(law_context_path, "w") as f:
-        json.dump(law_data, f)
+    write_law_context(law_data)
 
     status_text.markdown("### 🔗 2/4: Linking Comments to Clauses (MiniLM)...")
     progress_bar.progress(50)
-    linked_df = link_comments_to_law(df)
+    linked_df = link_comments_to_law(df, law_name)
 
     status_text.markdown("### 🧠 3/4: Analyzing Sentiment (RoBERTa)...")
     progress_bar.progress(75)
@@ -548,30 +557,27 @@ def run_cached_analysis(law_name, file_bytes):
         (final_df['Sentiment_Label'] != 'N/A') &
         (final_df['Linked_Clause'] != 'Irrelevant')
     ]
-    summary = clean_df.groupby(['Linked_Clause', 'Sentiment_Label']).size().unstack(fill_value=0)
+    summary = clean_df.groupby(['Linked_Clause', 'Sentiment_Label'], observed=True).size().unstack(fill_value=0)
     for col in ['negative', 'positive']:
         if col not in summary.columns:
             summary[col] = 0
 
     insights = {}
+    token_stats = {}
     if summary['negative'].sum() > 0:
         opp_sec = summary['negative'].idxmax()
-        opp_comments = clean_df[
-            (clean_df['Linked_Clause'] == opp_sec) &
-            (clean_df['Sentiment_Label'] == 'negative')
-        ]['Comment'].tolist()
+        opp_comments = select_insight_comments(clean_df, opp_sec, 'negative', token_stats)
         insights['opposed_sec'] = opp_sec
         insights['opposed_text'] = get_groq_insight(opp_comments, law_name, opp_sec, "negative")
 
     if summary['positive'].sum() > 0:
         sup_sec = summary['positive'].idxmax()
-        sup_comments = clean_df[
-            (clean_df['Linked_Clause'] == sup_sec) &
-            (clean_df['Sentiment_Label'] == 'positive')
-        ]['Comment'].tolist()
+        sup_comments = select_insight_comments(clean_df, sup_sec, 'positive', token_stats)
         insights['supported_sec'] = sup_sec
         insights['supported_text'] = get_groq_insight(sup_comments, law_name, sup_sec, "positive")
 
+    log_token_savings(token_stats)
+    record_request_latency(time.perf_counter() - request_start)
     return clean_df, insights
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -583,6 +589,8 @@ if 'final_data' not in st.session_state:
     st.session_state.final_data = None
 if 'insights' not in st.session_state:
     st.session_state.insights = {}
+if 'clause_insights' not in st.session_state:
+    st.session_state.clause_insights = {}
 
 def set_step(step_num):
     st.session_state.step = step_num
@@ -591,14 +599,27 @@ def set_step(step_num):
 # UI HELPERS
 # ─────────────────────────────────────────────────────────────────────────────
 
+def model_badge():
+    warm = warmup_status()
+    if warm["status"] == "ready":
+        cold = warm["timings"].get("cold_start_s")
+        return f'<span class="navbar-badge" style="color:#34d399;" title="Cold start {cold}s">● Models ready</span>'
+    if warm["status"] == "failed":
+        return f'<span class="navbar-badge" style="color:#f87171;" title="{warm["error"]}">● Models failed to load</span>'
+    return '<span class="navbar-badge" style="color:#fbbf24;">● Models warming up…</span>'
+
+
 def navbar():
-    st.markdown("""
+    st.markdown(f"""
     <div class="navbar">
       <div class="navbar-brand">
         <div class="navbar-mark">⚖️</div>
         PolicyIQ
       </div>
-      <span class="navbar-badge">Public Comment Intelligence</span>
+      <div style="display:flex;gap:8px;">
+        {model_badge()}
+        <span class="navbar-badge">Public Comment Intelligence</span>
+      </div>
     </div>
     """, unsafe_allow_html=True)
 
@@ -647,6 +668,24 @@ def step_progress(current: int, placeholder=None):
 def divider():
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
 
+
+def clause_insight_card(section, sentiment, text):
+    styles = {
+        'negative': ("insight-opposed", "insight-header-bar-red", "🚨"),
+        'positive': ("insight-supported", "insight-header-bar-green", "✅"),
+    }
+    card_cls, bar_cls, icon = styles.get(sentiment, ("", "", "💬"))
+    card_style = "" if card_cls else "background:rgba(124,106,255,0.06);border:1px solid rgba(124,106,255,0.28);"
+    bar_style = "" if bar_cls else "background:rgba(124,106,255,0.15);border:1px solid rgba(124,106,255,0.25);color:#7c6aff;"
+    return f"""
+    <div class="insight-card {card_cls}" style="{card_style}margin-bottom:20px;">
+      <div class="insight-header-bar {bar_cls}" style="{bar_style}">
+        {icon} &nbsp;{section} · {sentiment.capitalize()}
+      </div>
+      <div class="insight-body">{text}</div>
+    </div>
+    """
+
 # Cleaned up Plotly base settings
 _PL = dict(
     paper_bgcolor="rgba(0,0,0,0)",
@@ -697,6 +736,7 @@ if st.session_state.step == 1:
             "Policy / Law Name",
             value="Personal Data Protection Bill, 2019",
         )
+        refresh_law = st.checkbox("Refresh law context (ignore cached clauses)", value=False)
         st.markdown("<div style='height:16px'></div>", unsafe_allow_html=True)
         uploaded_file = st.file_uploader("Upload Comments (CSV)", type=["csv"])
 
@@ -719,6 +759,7 @@ if st.session_state.step == 1:
                 if st.button("Run Analysis", use_container_width=True):
                     st.session_state.file_bytes = uploaded_file.getvalue()
                     st.session_state.law_name   = law_name
+                    st.session_state.refresh_law = refresh_law
                     set_step(2)
                     st.rerun()
         else:
@@ -768,9 +809,14 @@ elif st.session_state.step == 2:
     try:
         status_text.markdown("Initialising pipeline…")
         
+        refresh_law = st.session_state.get('refresh_law', False)
+        if refresh_law:
+            # Otherwise the memoized analysis (built on the old clauses) would be served again
+            run_cached_analysis.clear()
         clean_df, insights = run_cached_analysis(
             st.session_state.law_name,
             st.session_state.file_bytes,
+            _refresh_law=refresh_law,
         )
         
         status_text.markdown("Analysis complete…")
@@ -778,6 +824,7 @@ elif st.session_state.step == 2:
         
         st.session_state.final_data = clean_df
         st.session_state.insights   = insights
+        st.session_state.clause_insights = {}
         set_step(3)
         st.rerun()
 
@@ -890,7 +937,7 @@ elif st.session_state.step == 3:
         unsafe_allow_html=True,
     )
 
-    bar_data = df.groupby(['Linked_Clause', 'Sentiment_Label']).size().reset_index(name='Count')
+    bar_data = df.groupby(['Linked_Clause', 'Sentiment_Label'], observed=True).size().reset_index(name='Count')
 
     fig_bar = px.bar(
         bar_data,
@@ -962,4 +1009,46 @@ elif st.session_state.step == 3:
         </div>
         """, unsafe_allow_html=True)
 
+    divider()
+
+    # ── ROW 4: EVERY CLAUSE / SENTIMENT (filled in as each insight arrives) ──
+    st.markdown("""
+    <div class="insights-section-title">
+      🧩 Clause-by-Clause Insights
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Only the pair list on reruns; comments are selected when generation is requested
+    clause_pairs = insight_pairs(df)
+    pending_pairs = [
+        pair for pair in clause_pairs
+        if pair not in st.session_state.clause_insights or insight_failed(st.session_state.clause_insights[pair])
+    ]
+    generate_all = False
+    if pending_pairs:
+        label = "Retry failed clauses" if st.session_state.clause_insights else "Generate for every clause"
+        _, gen_col, _ = st.columns([2, 1, 2])
+        with gen_col:
+            generate_all = st.button(label, use_container_width=True)
+
+    cc1, cc2 = st.columns(2, gap="large")
+    card_slots = {}
+    for i, (section, sentiment) in enumerate(clause_pairs):
+        with (cc1 if i % 2 == 0 else cc2):
+            card_slots[(section, sentiment)] = st.empty()
+        text = st.session_state.clause_insights.get((section, sentiment))
+        if generate_all and (section, sentiment) in pending_pairs:
+            card_slots[(section, sentiment)].markdown(clause_insight_card(section, sentiment, "Generating…"), unsafe_allow_html=True)
+        elif text is not None:
+            card_slots[(section, sentiment)].markdown(clause_insight_card(section, sentiment, text), unsafe_allow_html=True)
+
+    if generate_all:
+        def show_clause_insight(section, sentiment, text):
+            st.session_state.clause_insights[(section, sentiment)] = text
+            card_slots[(section, sentiment)].markdown(clause_insight_card(section, sentiment, text), unsafe_allow_html=True)
+
+        generate_insights(collect_insight_tasks(df, pairs=pending_pairs), law_name, on_result=show_clause_insight)
+        # Redraw so the button reflects what is still missing or failed
+        st.rerun()
+
     st.markdown('</div>', unsafe_allow_html=True)  # close page-wrap-wide
\ No newline at end of file
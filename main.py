@@ -1,41 +1,144 @@
+import argparse
 import os
 import pandas as pd
-from src.law_fetcher import store_law_summary
-from src.linker import link_comments_to_law
-from src.sentiment_engine import analyze_sentiment
-from src.insight_engine import analyze_insights
+from src.backends import INFERENCE_BACKEND, model_id
+from src.checkpoints import PIPELINE_STAGES, content_hash, file_hash, frame_hash, print_stage_report, run_stage
+from src.groq_client import GROQ_MODEL
+from src.incremental import INSIGHT_REFRESH_THRESHOLD, run_incremental
+from src.law_fetcher import LAW_CACHE_TTL_DAYS, store_law_summary
+from src.law_pack import clauses_hash
+from src.linker import RELEVANCE_THRESHOLD, ensure_law_pack, get_linker_model_id, link_comments_to_law
+from src.sentiment_engine import MAX_LENGTH, MODEL_NAME, analyze_sentiment, generate_final_report
+from src.streaming import STREAM_CHUNK_ROWS, run_streaming_pipeline
+from src.insight_engine import INSIGHT_PROMPT_VERSION, analyze_insights, insights_complete
+from src.results_store import RESULT_PATH, compact_results, save_results
 
-def run_full_pipeline(law_name, raw_csv_path):
+def run_full_pipeline(law_name, raw_csv_path, force_stages=(), output_path=RESULT_PATH,
+                      sentiment_mode="full", cascade_threshold=None, compare_full=False, top_k=1):
+    """
+    Runs the four stages, each behind a checkpoint keyed by a hash of its inputs
+    and configuration, so a re-run resumes from the first stage whose inputs
+    changed. Stages named in force_stages are recomputed regardless.
+    sentiment_mode="cascade" labels with the MiniLM linear head first (see
+    src.sentiment_cascade); compare_full reruns that stage to report agreement
+    with full RoBERTa.
+    top_k > 1 also links each comment to up to top_k sections (see
+    link_comments_to_law) and the report counts it against each of them.
+    """
     if not os.path.exists(raw_csv_path):
         return f"Error: Could not find input file at {raw_csv_path}"
 
     df = pd.read_csv(raw_csv_path)
+    report = []
     # Step 1: Fetch Law Context
     print("\n[1/4] Fetching law summary...")
-    store_law_summary(law_name)
+    law_status = {}
+    # A stale fallback copy is used for this run but never checkpointed
+    law_data, law_hash = run_stage(
+        "law", content_hash("law", law_name, GROQ_MODEL),
+        lambda: store_law_summary(
+            law_name, refresh="law" in force_stages,
+            comments=df['Comment'] if 'Comment' in df.columns else None, status=law_status,
+        ),
+        clauses_hash, report, force="law" in force_stages, max_age=LAW_CACHE_TTL_DAYS * 86400,
+        keep=lambda _: law_status.get("complete", False),
+    )
+    if not law_data:
+        return "Pipeline Failed: No law context."
+    # Cheap when the pack is already built; restores it if the law pack was removed
+    ensure_law_pack(law_name, law_data)
 
     # Step 2: Link Comments to Law
     print("\n[2/4] Linking comments to law...")
-    linked_df = link_comments_to_law(df)
+    linked_df, linked_hash = run_stage(
+        "link", content_hash("link", file_hash(raw_csv_path), law_hash, get_linker_model_id(), RELEVANCE_THRESHOLD, top_k),
+        lambda: link_comments_to_law(df, law_name, top_k=top_k),
+        frame_hash, report, force="link" in force_stages,
+    )
     if linked_df is None:
         return "Pipeline Failed: Linker returned None."
 
     # Step 3: Sentiment Analysis
     print("\n[3/4] Performing sentiment analysis...")
-    final_df = analyze_sentiment(linked_df)
+    if sentiment_mode == "cascade" and cascade_threshold is None:
+        # Imported here: the cascade pulls in scipy
+        from src.sentiment_cascade import CASCADE_CONFIDENCE
+        cascade_threshold = CASCADE_CONFIDENCE
+    sentiment_config = [sentiment_mode, cascade_threshold if sentiment_mode == "cascade" else None]
+    final_df, final_hash = run_stage(
+        "sentiment", content_hash("sentiment", linked_hash, model_id(MODEL_NAME, INFERENCE_BACKEND), MAX_LENGTH, sentiment_config),
+        lambda: compact_results(analyze_sentiment(
+            linked_df.copy(), mode=sentiment_mode, cascade_threshold=cascade_threshold,
+            keep_probs=True, compare_full=compare_full,
+        )),
+        # The agreement report only exists on a real run
+        frame_hash, report, force="sentiment" in force_stages or compare_full,
+    )
     if final_df is None:
         return "Pipeline Failed: Sentiment Engine returned None."
 
-    final_output_path = "data/processed/final_analysis_result.csv"
-    final_df.to_csv(final_output_path, index=False)
-    print(f"Final data saved to {final_output_path}")
+    save_results(final_df, output_path)
+    print(f"Final data saved to {output_path}")
+    generate_final_report(final_df)
 
     # Step 4: Insight Generation
     print("\n[4/4] Generating insights...")
-    analyze_insights(final_output_path, law_name)
-    
+    # Insights with API errors in them are not checkpointed, so a re-run retries just this stage
+    run_stage(
+        "insights", content_hash("insights", final_hash, law_name, GROQ_MODEL, INSIGHT_PROMPT_VERSION),
+        lambda: analyze_insights(final_df, law_name),
+        lambda insights: content_hash(repr(insights)), report, force="insights" in force_stages, keep=insights_complete,
+    )
+
+    print_stage_report(report)
     return "Pipeline Completed Successfully!"
 
 if __name__ == "__main__":
-    input_file = os.path.join("data", "raw", "datasetv1.csv")
-    run_full_pipeline("Personal Data Protection Bill, 2019", input_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the PolicyIQ pipeline on one comment file")
+    parser.add_argument("--law", default="Personal Data Protection Bill, 2019")
+    parser.add_argument("--input", default=os.path.join("data", "raw", "datasetv1.csv"))
+    parser.add_argument(
+        "--force-stage", action="append", default=[], choices=PIPELINE_STAGES,
+        help="Recompute this stage even if its checkpoint matches (repeatable)",
+    )
+    parser.add_argument(
+        "--sentiment-mode", choices=("full", "cascade"), default="full",
+        help="cascade: MiniLM linear head first, RoBERTa only for low-confidence comments",
+    )
+    parser.add_argument(
+        "--cascade-threshold", type=float, default=None,
+        help="Cascade mode: confidence below which RoBERTa re-scores a comment (default CASCADE_CONFIDENCE)",
+    )
+    parser.add_argument(
+        "--compare-full", action="store_true",
+        help="Cascade mode: also run full RoBERTa and report the cascade's agreement with it",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=1,
+        help="Link each comment to up to this many sections and count it against each of them",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only process comments that are new or changed since the last incremental run for this law",
+    )
+    parser.add_argument(
+        "--insight-threshold", type=float, default=INSIGHT_REFRESH_THRESHOLD,
+        help="Incremental mode: regenerate a clause insight once its count moves by more than this fraction",
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Read, link and score the input in chunks, appending to the output as it goes",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS, help="Streaming mode: rows per chunk")
+    args = parser.parse_args()
+    if args.stream:
+        print(run_streaming_pipeline(args.law, args.input, chunk_rows=args.chunk_rows))
+    elif args.incremental:
+        result_df, state = run_incremental(args.law, args.input, insight_threshold=args.insight_threshold)
+        if result_df is not None:
+            print(f"Incremental result holds {len(result_df)} comments across {len(state['counts'])} clause/sentiment pairs.")
+    else:
+        print(run_full_pipeline(
+            args.law, args.input, force_stages=args.force_stage, sentiment_mode=args.sentiment_mode,
+            cascade_threshold=args.cascade_threshold, compare_full=args.compare_full, top_k=args.top_k,
+        ))
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import torch
+from scipy.special import softmax
+from src.backends import BACKENDS, load_sentence_model, load_sequence_classifier
+from src.linker import LINKER_MODEL_NAME, assign_clauses, load_law_context
+from src.sentiment_engine import MODEL_NAME, BATCH_SIZE
+
+
+def _clause_codes(model, comments, clause_summaries):
+    clause_vectors = model.encode(clause_summaries, normalize_embeddings=True)
+    comment_vectors = model.encode(comments, batch_size=64, normalize_embeddings=True)
+    clause_codes, _ = assign_clauses(np.matmul(comment_vectors, clause_vectors.T))
+    return clause_codes
+
+
+def _sentiment_ids(tokenizer, model, comments):
+    label_ids = []
+    for i in range(0, len(comments), BATCH_SIZE):
+        inputs = tokenizer(comments[i : i + BATCH_SIZE], padding=True, truncation=True, max_length=128, return_tensors="pt")
+        with torch.no_grad():
+            logits = model(**inputs).logits.detach().numpy()
+        label_ids.append(softmax(logits, axis=1).argmax(axis=1))
+    return np.concatenate(label_ids)
+
+
+def backend_agreement_report(comments, backends=BACKENDS):
+    """
+    Runs MiniLM linking and RoBERTa sentiment on `comments` with every backend and
+    reports throughput and label agreement against the PyTorch fp32 reference.
+    Caches are bypassed so every backend does the full work.
+    """
+    law_clauses = load_law_context()
+    if not law_clauses:
+        return None
+    clause_summaries = [c['summary'] for c in law_clauses]
+
+    rows = []
+    reference = {}
+    for backend in ("torch",) + tuple(b for b in backends if b != "torch"):
+        print(f"Benchmarking backend: {backend}")
+        linker_model = load_sentence_model(LINKER_MODEL_NAME, backend)
+        start = time.perf_counter()
+        clause_codes = _clause_codes(linker_model, comments, clause_summaries)
+        link_seconds = time.perf_counter() - start
+
+        tokenizer, sentiment_model = load_sequence_classifier(MODEL_NAME, backend)
+        start = time.perf_counter()
+        sentiment_ids = _sentiment_ids(tokenizer, sentiment_model, comments)
+        sentiment_seconds = time.perf_counter() - start
+
+        if backend == "torch":
+            reference = {"clauses": clause_codes, "sentiment": sentiment_ids}
+
+        rows.append({
+            "Backend": backend,
+            "Linker_Comments_per_s": round(len(comments) / link_seconds, 1),
+            "Sentiment_Comments_per_s": round(len(comments) / sentiment_seconds, 1),
+            "Clause_Agreement": round(float((clause_codes == reference["clauses"]).mean()), 4),
+            "Sentiment_Agreement": round(float((sentiment_ids == reference["sentiment"]).mean()), 4),
+        })
+
+    report = pd.DataFrame(rows).set_index("Backend")
+    print("\nBACKEND AGREEMENT REPORT (vs torch fp32)")
+    print(report.to_string())
+    return report
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("data", "raw", "test_comments.csv")
+    comments = pd.read_csv(csv_path)['Comment'].astype(str).tolist()
+    backend_agreement_report(comments)
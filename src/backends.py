@@ -0,0 +1,105 @@
+import os
+
+# torch:      PyTorch fp32 (reference)
+# torch-int8: PyTorch with dynamic int8 quantization of the Linear layers
+# onnx:       ONNX Runtime fp32, exported once and cached on disk
+# onnx-int8:  ONNX Runtime with dynamic int8 quantization, exported once and cached on disk
+# The onnx backends additionally need `pip install optimum[onnxruntime]`.
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+INFERENCE_BACKEND = os.getenv("POLICYIQ_BACKEND", "torch")
+
+ONNX_CACHE_DIR = os.path.join("data", "cache", "onnx")
+# Instruction set the int8 ONNX graphs are tuned for: arm64, avx2, avx512 or avx512_vnni
+ONNX_QUANT_ARCH = os.getenv("POLICYIQ_ONNX_ARCH", "avx2")
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+
+def model_id(model_name, backend):
+    """Identifier used to key caches, so results from different backends never mix."""
+    return model_name if backend == "torch" else f"{model_name}+{backend}"
+
+
+def _export_dir(model_name):
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+
+
+def _quantize_dynamic(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _from_pretrained_safetensors(load, model_name, **kwargs):
+    """Prefers safetensors weights (memory-mapped on load), falling back to the default files."""
+    try:
+        return load(model_name, use_safetensors=True, **kwargs)
+    except (OSError, ValueError):
+        return load(model_name, **kwargs)
+
+
+def load_sentence_model(model_name, backend):
+    from sentence_transformers import SentenceTransformer
+
+    check_backend(backend)
+    if backend in ("torch", "torch-int8"):
+        try:
+            model = SentenceTransformer(model_name, device="cpu", model_kwargs={"use_safetensors": True})
+        except (OSError, ValueError):
+            model = SentenceTransformer(model_name, device="cpu")
+        return model if backend == "torch" else _quantize_dynamic(model)
+
+    export_dir = _export_dir(model_name)
+    if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+        print(f"Exporting {model_name} to ONNX (one-time)...")
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        model.save_pretrained(export_dir)
+    if backend == "onnx":
+        return SentenceTransformer(export_dir, device="cpu", backend="onnx")
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    quant_file = os.path.join("onnx", f"model_qint8_{ONNX_QUANT_ARCH}.onnx")
+    if not os.path.exists(os.path.join(export_dir, quant_file)):
+        print(f"Quantizing {model_name} ONNX graph to int8 ({ONNX_QUANT_ARCH})...")
+        model = SentenceTransformer(export_dir, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANT_ARCH, export_dir)
+    return SentenceTransformer(export_dir, device="cpu", backend="onnx", model_kwargs={"file_name": quant_file})
+
+
+def load_sequence_classifier(model_name, backend):
+    """Returns (tokenizer, model) ready for inference on CPU."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    check_backend(backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend in ("torch", "torch-int8"):
+        import torch
+        model = _from_pretrained_safetensors(AutoModelForSequenceClassification.from_pretrained, model_name)
+        model.to(torch.device("cpu"))
+        model.eval()
+        if backend == "torch-int8":
+            model = _quantize_dynamic(model)
+        return tokenizer, model
+
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    export_dir = _export_dir(model_name)
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+        print(f"Exporting {model_name} to ONNX (one-time)...")
+        model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+        tokenizer.save_pretrained(export_dir)
+    if backend == "onnx":
+        return tokenizer, ORTModelForSequenceClassification.from_pretrained(export_dir)
+
+    quant_file = "model_quantized.onnx"
+    if not os.path.exists(os.path.join(export_dir, quant_file)):
+        print(f"Quantizing {model_name} ONNX graph to int8 ({ONNX_QUANT_ARCH})...")
+        quantizer = ORTQuantizer.from_pretrained(export_dir, file_name="model.onnx")
+        qconfig = getattr(AutoQuantizationConfig, ONNX_QUANT_ARCH)(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+    return tokenizer, ORTModelForSequenceClassification.from_pretrained(export_dir, file_name=quant_file)
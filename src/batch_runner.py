@@ -0,0 +1,213 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+from src.law_pack import law_slug
+
+BATCH_OUTPUT_DIR = os.path.join("data", "processed", "batch")
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+MAX_JOB_RETRIES = 1
+SERVER_START_TIMEOUT_S = 300
+SUCCESS_MESSAGE = "Pipeline Completed Successfully!"
+
+
+def default_output_path(law, input_path):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(BATCH_OUTPUT_DIR, f"{law_slug(law)}__{stem}.parquet")
+
+
+def load_manifest(path):
+    """
+    Jobs from a CSV with columns law, input (and optionally output), or a JSON
+    list of objects with the same keys.
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            rows = json.load(f)
+    else:
+        rows = pd.read_csv(path).to_dict("records")
+
+    jobs = []
+    for i, row in enumerate(rows):
+        law, input_path, output = row.get("law"), row.get("input"), row.get("output")
+        if not isinstance(law, str) or not isinstance(input_path, str):
+            print(f"Skipping manifest row {i + 1}: it needs 'law' and 'input'.")
+            continue
+        if not isinstance(output, str):
+            output = default_output_path(law, input_path)
+        jobs.append({"id": len(jobs) + 1, "law": law, "input": input_path, "output": output})
+    return jobs
+
+
+def start_model_server(port):
+    """Starts src.model_server in a subprocess and waits until it answers /info."""
+    process = subprocess.Popen([sys.executable, "-m", "src.model_server", "--port", str(port)])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Model server exited during start-up.")
+        try:
+            with urllib.request.urlopen(url + "/info", timeout=2):
+                return process, url
+        except OSError:
+            time.sleep(1)
+    process.terminate()
+    raise RuntimeError(f"Model server did not come up within {SERVER_START_TIMEOUT_S}s.")
+
+
+def prepare_laws(laws):
+    """
+    Fetches each law's context and builds its law pack once, up front, so every
+    job for that law reads them from the cache instead of refetching.
+    Returns {law: ready}.
+    """
+    # Imported here so POLICYIQ_* settings made by main() are seen at import time
+    from src.law_fetcher import get_law_clauses
+    from src.linker import ensure_law_pack
+
+    ready = {}
+    for law in laws:
+        clauses = get_law_clauses(law)
+        if clauses:
+            ensure_law_pack(law, clauses)
+        ready[law] = bool(clauses)
+    return ready
+
+
+def _init_worker():
+    # Each worker loads (or connects to) the models once and keeps them warm for every job it runs
+    from src.warmup import start_warmup, wait_until_ready
+    start_warmup()
+    wait_until_ready()
+
+
+def run_job(job):
+    """Runs one (law, input) job in a worker process. Never raises."""
+    from main import run_full_pipeline
+
+    start = time.perf_counter()
+    try:
+        message = run_full_pipeline(job["law"], job["input"], output_path=job["output"])
+    except Exception as e:
+        message = f"Error: {e}"
+    seconds = time.perf_counter() - start
+
+    ok = message == SUCCESS_MESSAGE
+    rows = len(pd.read_csv(job["input"], usecols=["Comment"])) if ok else 0
+    return {"ok": ok, "message": message, "seconds": seconds, "rows": rows}
+
+
+def run_batch(jobs, workers=DEFAULT_WORKERS, retries=MAX_JOB_RETRIES):
+    """Runs the jobs on a process pool, retrying failed ones. Returns one status dict per job."""
+    statuses = {job["id"]: {"job": job, "status": "pending", "attempts": 0, "seconds": 0.0, "rows": 0, "message": ""}
+                for job in jobs}
+
+    print(f"Preparing law context for {len({job['law'] for job in jobs})} laws...")
+    law_ready = prepare_laws(sorted({job["law"] for job in jobs}))
+    runnable = []
+    for job in jobs:
+        if law_ready[job["law"]]:
+            runnable.append(job)
+        else:
+            statuses[job["id"]].update(status="failed", message="No law context.")
+
+    # Spawned workers start clean instead of inheriting the parent's loaded models and threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        pending = {}
+
+        def submit(job):
+            statuses[job["id"]]["attempts"] += 1
+            statuses[job["id"]]["status"] = "running"
+            pending[pool.submit(run_job, job)] = job
+
+        for job in runnable:
+            submit(job)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                status = statuses[job["id"]]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {"ok": False, "message": f"Worker error: {e}", "seconds": 0.0, "rows": 0}
+                status.update(seconds=status["seconds"] + outcome["seconds"], rows=outcome["rows"], message=outcome["message"])
+
+                if outcome["ok"]:
+                    status["status"] = "done"
+                    print(f"[job {job['id']}] done: {job['law']} / {job['input']} in {outcome['seconds']:.1f}s")
+                elif status["attempts"] <= retries:
+                    print(f"[job {job['id']}] failed ({outcome['message']}), retrying...")
+                    submit(job)
+                else:
+                    status["status"] = "failed"
+                    print(f"[job {job['id']}] failed after {status['attempts']} attempts: {outcome['message']}")
+
+    # The pool has exited, so the parent is now the cache's only writer
+    from src.linker import merge_embedding_spills
+    merge_embedding_spills()
+
+    return [statuses[job["id"]] for job in jobs]
+
+
+def print_batch_summary(statuses, wall_seconds):
+    print("\n --- BATCH SUMMARY ---")
+    print(f"   {'job':>4} {'law':<32} {'input':<24} {'status':<7} {'tries':>5} {'rows':>8} {'secs':>8} {'rows/s':>8}")
+    for status in statuses:
+        job = status["job"]
+        rate = status["rows"] / status["seconds"] if status["seconds"] and status["rows"] else 0.0
+        print(f"   {job['id']:>4} {job['law'][:32]:<32} {os.path.basename(job['input'])[:24]:<24} "
+              f"{status['status']:<7} {status['attempts']:>5} {status['rows']:>8} {status['seconds']:>8.1f} {rate:>8.1f}")
+
+    n_done = sum(status["status"] == "done" for status in statuses)
+    total_rows = sum(status["rows"] for status in statuses)
+    print(f"   {n_done}/{len(statuses)} jobs succeeded, {total_rows} comments in {wall_seconds:.1f}s "
+          f"({total_rows / wall_seconds if wall_seconds else 0:.1f} comments/s overall)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PolicyIQ pipeline for every (law, input file) job in a manifest")
+    parser.add_argument("manifest", help="CSV with columns law,input[,output] or a JSON list of the same")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--retries", type=int, default=MAX_JOB_RETRIES, help="Extra attempts for a failed job")
+    parser.add_argument(
+        "--start-server", type=int, metavar="PORT", default=None,
+        help="Start a model server on PORT so all workers share one warm copy of the models",
+    )
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    if not jobs:
+        print("No jobs in the manifest.")
+        return
+
+    server = None
+    if args.start_server is not None:
+        server, url = start_model_server(args.start_server)
+        os.environ["POLICYIQ_MODEL_SERVER"] = url
+    if args.workers > 1:
+        # Workers inherit these; split the cores between them and keep the
+        # embedding cache single-writer (workers spill, the parent merges at the end)
+        os.environ.setdefault("POLICYIQ_TORCH_THREADS", str(max(1, (os.cpu_count() or 2) // args.workers)))
+        os.environ["POLICYIQ_EMBEDDING_CACHE_READONLY"] = "1"
+
+    start = time.perf_counter()
+    try:
+        statuses = run_batch(jobs, workers=args.workers, retries=args.retries)
+    finally:
+        if server is not None:
+            server.terminate()
+    print_batch_summary(statuses, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+import pandas as pd
+from src.law_pack import temp_path
+
+CHECKPOINT_DIR = os.path.join("data", "cache", "checkpoints")
+PIPELINE_STAGES = ("law", "link", "sentiment", "insights")
+# Older checkpoints of a stage beyond this many are deleted; batch runs keep one per job
+CHECKPOINTS_PER_STAGE = 50
+
+
+def content_hash(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def frame_hash(df):
+    h = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # List columns (e.g. Top_Clauses) aren't hashable as-is
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    h.update(row_hashes.to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _checkpoint_path(stage, key):
+    return os.path.join(CHECKPOINT_DIR, f"{stage}-{key[:24]}.pkl")
+
+
+def load_checkpoint(stage, key, max_age=None):
+    """Returns the stored entry ({"result", "output_hash", "seconds", "created_at"}) or None."""
+    path = _checkpoint_path(stage, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            entry = pickle.load(f)
+    except Exception as e:
+        print(f"Warning: Unreadable {stage} checkpoint ({e}), recomputing.")
+        return None
+    if entry.get("key") != key:
+        return None
+    if max_age is not None and time.time() - entry["created_at"] > max_age:
+        return None
+    return entry
+
+
+def save_checkpoint(stage, key, result, output_hash, seconds):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = _checkpoint_path(stage, key)
+    entry = {"key": key, "result": result, "output_hash": output_hash, "seconds": seconds, "created_at": time.time()}
+    tmp_path = temp_path(path)
+    with open(tmp_path, "wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    try:
+        old = sorted(
+            (os.path.join(CHECKPOINT_DIR, name) for name in os.listdir(CHECKPOINT_DIR)
+             if name.startswith(f"{stage}-") and name.endswith(".pkl")),
+            key=os.path.getmtime, reverse=True,
+        )
+    except FileNotFoundError:
+        # A concurrent run pruned a file mid-listing; the next save prunes instead
+        return
+    for stale_path in old[CHECKPOINTS_PER_STAGE:]:
+        try:
+            os.remove(stale_path)
+        except FileNotFoundError:
+            # Another process pruned it first
+            pass
+
+
+def run_stage(stage, key, compute, output_hash, report, force=False, max_age=None, keep=None):
+    """
+    Returns (result, output_hash) for one pipeline stage, served from its
+    checkpoint when `key` (a hash of the stage's inputs and config) matches.
+    output_hash(result) fingerprints the output for the next stage's key;
+    keep(result) can veto checkpointing a partial result (None is never kept).
+    A row per stage is appended to `report`.
+    """
+    if not force:
+        entry = load_checkpoint(stage, key, max_age)
+        if entry is not None:
+            print(f"[checkpoint] {stage}: hit ({key[:8]}), saved {entry['seconds']:.1f}s")
+            report.append({"stage": stage, "status": "hit", "seconds": 0.0, "saved_s": entry["seconds"]})
+            return entry["result"], entry["output_hash"]
+
+    start = time.perf_counter()
+    result = compute()
+    seconds = time.perf_counter() - start
+    if result is None:
+        report.append({"stage": stage, "status": "failed", "seconds": seconds, "saved_s": 0.0})
+        return None, None
+
+    result_hash = output_hash(result)
+    if keep is None or keep(result):
+        save_checkpoint(stage, key, result, result_hash, seconds)
+        status = "forced" if force else "miss"
+    else:
+        status = "partial"
+    print(f"[checkpoint] {stage}: {status} ({key[:8]}), ran in {seconds:.1f}s")
+    report.append({"stage": stage, "status": status, "seconds": seconds, "saved_s": 0.0})
+    return result, result_hash
+
+
+def print_stage_report(report):
+    print("\n --- STAGE REPORT ---")
+    print(f"   {'stage':<10} {'status':<8} {'ran (s)':>8} {'saved (s)':>10}")
+    for row in report:
+        print(f"   {row['stage']:<10} {row['status']:<8} {row['seconds']:>8.1f} {row['saved_s']:>10.1f}")
+    print(f"   Total time saved by checkpoints: {sum(row['saved_s'] for row in report):.1f}s")
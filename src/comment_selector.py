@@ -0,0 +1,49 @@
+import numpy as np
+from src.dedup import collapse_duplicates
+from src.groq_client import estimate_tokens
+
+# Prompt budget for the comments of one clause/sentiment insight
+INSIGHT_TOKEN_BUDGET = 250
+MAX_REPRESENTATIVES = 10
+
+
+def select_representatives(texts, embeddings, scores=None, token_budget=INSIGHT_TOKEN_BUDGET, max_items=MAX_REPRESENTATIVES):
+    """
+    Picks a small, diverse, high-confidence subset of texts for an LLM prompt.
+    Starts from the confidence-weighted medoid, then repeatedly adds the comment
+    farthest (in cosine distance) from everything picked so far, weighted by
+    confidence, until the token budget or max_items is reached.
+    `embeddings` must be L2-normalized, as returned by the linker.
+    """
+    if not texts:
+        return []
+
+    # Templated comments differ only in case/punctuation; keep one of each
+    unique_texts, inverse = collapse_duplicates(texts, "normalized")
+    _, first_idx = np.unique(inverse, return_index=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)[first_idx]
+    weights = np.ones(len(first_idx), dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32)[first_idx]
+
+    centroid = embeddings.mean(axis=0)
+    start = int(np.argmax((embeddings @ centroid) * weights))
+
+    selected = [start]
+    used_tokens = estimate_tokens(unique_texts[start])
+    min_distance = 1.0 - embeddings @ embeddings[start]
+    min_distance[start] = 0.0
+
+    while len(selected) < max_items:
+        candidate = int(np.argmax(min_distance * weights))
+        if min_distance[candidate] <= 1e-6:
+            break
+        cost = estimate_tokens(unique_texts[candidate])
+        if used_tokens + cost > token_budget:
+            # Too long for what's left of the budget; try the next-farthest instead
+            min_distance[candidate] = 0.0
+            continue
+        selected.append(candidate)
+        used_tokens += cost
+        min_distance = np.minimum(min_distance, 1.0 - embeddings @ embeddings[candidate])
+        min_distance[selected] = 0.0
+
+    return [unique_texts[i] for i in selected]
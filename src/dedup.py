@@ -0,0 +1,35 @@
+import re
+import numpy as np
+import pandas as pd
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+# exact:      byte-identical text only
+# casefold:   also folds whitespace and case (MiniLM is uncased, so embeddings are unchanged)
+# normalized: also strips punctuation (approximate for case/punctuation-aware models like RoBERTa)
+DEDUP_LEVELS = ("exact", "casefold", "normalized")
+
+
+def normalize_comment(text, level="normalized"):
+    text = str(text)
+    if level == "exact":
+        return text
+    if level == "normalized":
+        text = _PUNCTUATION.sub(" ", text)
+    return " ".join(text.split()).lower()
+
+
+def collapse_duplicates(texts, level="exact"):
+    """
+    Returns (unique_texts, inverse) such that unique_texts[inverse[i]] stands in for texts[i].
+    The first occurrence of each duplicate group is kept as its representative.
+    """
+    if level not in DEDUP_LEVELS:
+        raise ValueError(f"Unknown dedup level '{level}', expected one of {DEDUP_LEVELS}")
+
+    keys = [normalize_comment(t, level) for t in texts]
+    inverse, _ = pd.factorize(pd.Series(keys, dtype=object))
+    # factorize numbers groups in order of first appearance
+    _, first_idx = np.unique(inverse, return_index=True)
+    unique_texts = [texts[i] for i in first_idx]
+    return unique_texts, inverse
@@ -0,0 +1,224 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from src.dedup import normalize_comment
+
+CACHE_DIR = os.path.join("data", "cache", "embeddings")
+MAX_CACHE_MB = 512
+# Slots are allocated per process, so concurrent writers would overwrite each
+# other's vectors; processes that run side by side open the cache read-only and
+# spill their new embeddings to files that a single writer merges afterwards
+READ_ONLY = os.getenv("POLICYIQ_EMBEDDING_CACHE_READONLY", "0") == "1"
+# Keys are raw 16-byte digests; a bytes ("S") field would strip trailing NULs on read
+INDEX_DTYPE = [("key", "V16"), ("tick", "i8")]
+EMPTY_KEY = bytes(16)
+
+
+def normalize_text(text):
+    """Collapse whitespace and case; MiniLM is uncased so the embedding is unchanged."""
+    return normalize_comment(text, "casefold")
+
+
+def text_key(text, model_name):
+    """16-byte content hash of the normalized text, scoped to one model."""
+    payload = f"{model_name}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def key_array(keys):
+    """Packs 16-byte keys into a V16 array without touching their bytes."""
+    return np.frombuffer(b"".join(keys), dtype="V16")
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed embedding store.
+    Vectors live in a fixed-capacity memory-mapped float32 array; the index is a
+    compact (key, last_used) record per slot. When full, least-recently-used
+    slots are evicted. flush() only rewrites the index records of slots touched
+    since the last flush.
+    A read_only cache never writes the shared files: new vectors are kept in
+    memory and flushed to spill-*.npz files, which merge_spills() on a writable
+    cache folds in once no read-only process is running.
+    """
+
+    def __init__(self, model_name, dim, cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB, read_only=READ_ONLY):
+        self.model_name = model_name
+        self.dim = dim
+        self.read_only = read_only
+        self.capacity = max(1, int(max_mb * 1024 * 1024) // (dim * 4))
+
+        self.dir = self.cache_dir_for(model_name, cache_dir)
+        os.makedirs(self.dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.dir, "vectors.f32")
+        self._index_path = os.path.join(self.dir, "index.npy")
+        self._meta_path = os.path.join(self.dir, "meta.json")
+        self._lock = threading.Lock()
+        self._open()
+
+    @staticmethod
+    def cache_dir_for(model_name, cache_dir=CACHE_DIR):
+        safe_name = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in model_name)
+        return os.path.join(cache_dir, safe_name)
+
+    def _open(self):
+        meta = {"model_name": self.model_name, "dim": self.dim, "capacity": self.capacity, "key_dtype": "V16"}
+        stored_meta = None
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                stored_meta = json.load(f)
+
+        reuse = (
+            stored_meta == meta
+            and os.path.exists(self._vectors_path)
+            and os.path.exists(self._index_path)
+        )
+        if reuse:
+            mode = "r" if self.read_only else "r+"
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+            self._index = np.load(self._index_path)
+        elif self.read_only:
+            # Nothing usable on disk: behave as an empty cache
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._index = np.zeros(0, dtype=INDEX_DTYPE)
+        else:
+            if stored_meta is not None:
+                print("Embedding cache layout changed, starting a fresh cache.")
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="w+", shape=(self.capacity, self.dim))
+            self._index = np.zeros(self.capacity, dtype=INDEX_DTYPE)
+            with open(self._meta_path, "w") as f:
+                json.dump(meta, f)
+
+        keys = self._index["key"].tolist()
+        self._slots = {key: slot for slot, key in enumerate(keys) if key != EMPTY_KEY}
+        self._free = [slot for slot in range(len(keys) - 1, -1, -1) if keys[slot] == EMPTY_KEY]
+        self._tick = int(self._index["tick"].max()) if len(self._index) else 0
+        self._dirty_slots = set()
+        # A fresh cache writes its whole index once; after that flushes patch it in place
+        self._index_on_disk = reuse
+        self._spilled = {}
+        self._unspilled = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get_many(self, keys):
+        """Returns (vectors, hit_mask). Rows for misses are left as zeros."""
+        out = np.zeros((len(keys), self.dim), dtype=np.float32)
+        hits = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            self._tick += 1
+            rows, slots = [], []
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is not None:
+                    rows.append(i)
+                    slots.append(slot)
+            if rows:
+                slots = np.asarray(slots)
+                out[rows] = self._vectors[slots]
+                hits[rows] = True
+                self._index["tick"][slots] = self._tick
+                self._dirty_slots.update(slots.tolist())
+            if self._spilled:
+                for i, key in enumerate(keys):
+                    if not hits[i] and key in self._spilled:
+                        out[i] = self._spilled[key]
+                        hits[i] = True
+        return out, hits
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.read_only:
+            with self._lock:
+                for key, vector in zip(keys, vectors):
+                    if key not in self._slots and key not in self._spilled:
+                        self._spilled[key] = vector
+                        self._unspilled.append(key)
+            return
+        with self._lock:
+            self._tick += 1
+            pending = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._slots:
+                    pending[key] = vector
+            if not pending:
+                return
+
+            # Keep the newest entries if a single batch exceeds the whole cache
+            new_keys = list(pending)[-self.capacity:]
+            self._evict(len(new_keys) - len(self._free))
+
+            slots = np.array([self._free.pop() for _ in new_keys])
+            self._vectors[slots] = np.stack([pending[k] for k in new_keys])
+            self._index["key"][slots] = key_array(new_keys)
+            self._index["tick"][slots] = self._tick
+            for key, slot in zip(new_keys, slots.tolist()):
+                self._slots[key] = slot
+            self._dirty_slots.update(slots.tolist())
+
+    def _evict(self, count):
+        if count <= 0:
+            return
+        # Free slots are already available, so never pick them as victims
+        occupied = self._index["key"] != np.void(EMPTY_KEY)
+        ticks = np.where(occupied, self._index["tick"], np.iinfo(np.int64).max)
+        victims = np.argpartition(ticks, count - 1)[:count]
+        for slot in victims.tolist():
+            key = self._index["key"][slot].tobytes()
+            if key != EMPTY_KEY:
+                del self._slots[key]
+            self._index["key"][slot] = np.void(EMPTY_KEY)
+            self._index["tick"][slot] = 0
+            self._free.append(slot)
+            self._dirty_slots.add(slot)
+
+    def _write_spill(self):
+        keys = self._unspilled
+        tmp_path = os.path.join(self.dir, f"spill-{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=key_array(keys), vectors=np.stack([self._spilled[k] for k in keys]))
+        os.replace(tmp_path, tmp_path[:-len(".tmp")] + ".npz")
+        self._unspilled = []
+
+    def merge_spills(self):
+        """Folds spill files left by read-only processes into this cache. Returns the number of vectors merged."""
+        if self.read_only:
+            raise ValueError("merge_spills() needs a writable cache.")
+        merged = 0
+        for path in sorted(glob.glob(os.path.join(self.dir, "spill-*.npz"))):
+            with np.load(path) as spill:
+                keys = spill["keys"].tolist()
+                self.put_many(keys, spill["vectors"])
+            merged += len(keys)
+            os.remove(path)
+        self.flush()
+        return merged
+
+    def flush(self):
+        with self._lock:
+            if self.read_only:
+                if self._unspilled:
+                    self._write_spill()
+                return
+            if not self._dirty_slots:
+                return
+            # Vectors first, so an index record never points at an unwritten vector
+            self._vectors.flush()
+            if self._index_on_disk:
+                slots = np.fromiter(sorted(self._dirty_slots), dtype=np.int64)
+                index_file = np.lib.format.open_memmap(self._index_path, mode="r+")
+                index_file[slots] = self._index[slots]
+                index_file.flush()
+                del index_file
+            else:
+                tmp_path = self._index_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, self._index)
+                os.replace(tmp_path, self._index_path)
+                self._index_on_disk = True
+            self._dirty_slots.clear()
@@ -0,0 +1,43 @@
+import os
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent.parent / ".env"
+load_dotenv(env_path)
+
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for budgeting and rate limiting."""
+    return len(text) // 4 + 1
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_groq_api_key():
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY not found!")
+    return api_key
+
+
+def get_groq_client():
+    """Creates the Groq client on first use, so importing the pipeline needs no credentials."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from groq import Groq
+            _client = Groq(api_key=get_groq_api_key())
+    return _client
+
+
+def create_async_groq_client():
+    """
+    New AsyncGroq client. Its connection pool is bound to the running event loop,
+    so create one per asyncio.run() and share it across that run's requests.
+    """
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=get_groq_api_key())
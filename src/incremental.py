@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from src.backends import INFERENCE_BACKEND, model_id
+from src.groq_client import GROQ_MODEL
+from src.insight_engine import INSIGHT_PROMPT_VERSION, insight_failed, log_token_savings, select_insight_comments
+from src.law_fetcher import get_law_clauses
+from src.law_pack import clauses_hash, law_slug, temp_path
+from src.linker import IRRELEVANT, RELEVANCE_THRESHOLD, ensure_law_pack, get_linker_model_id, link_comments_to_law
+from src.results_store import compact_results, load_results, save_results
+from src.sentiment_engine import MAX_LENGTH, MODEL_NAME, analyze_sentiment
+
+INCREMENTAL_DIR = os.path.join("data", "processed", "incremental")
+# A clause/sentiment insight is regenerated once its comment count has moved by
+# more than this fraction since the insight was written
+INSIGHT_REFRESH_THRESHOLD = 0.2
+INSIGHT_SENTIMENTS = ("negative", "neutral", "positive")
+STATE_VERSION = 1
+
+
+def row_hash(text):
+    return hashlib.blake2b(str(text).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _state_paths(law_name):
+    state_dir = os.path.join(INCREMENTAL_DIR, law_slug(law_name))
+    return state_dir, os.path.join(state_dir, "result.parquet"), os.path.join(state_dir, "state.json")
+
+
+def _config_key(law_clauses):
+    # Anything that would change already-stored labels forces a full rebuild
+    return {
+        "version": STATE_VERSION,
+        "clauses_hash": clauses_hash(law_clauses),
+        "linker": [get_linker_model_id(), RELEVANCE_THRESHOLD],
+        "sentiment": [model_id(MODEL_NAME, INFERENCE_BACKEND), MAX_LENGTH],
+        "insights": [GROQ_MODEL, INSIGHT_PROMPT_VERSION],
+    }
+
+
+def load_incremental_state(law_name):
+    """Returns (result_df, state) from the last run for this law, or (None, None)."""
+    _, result_path, state_path = _state_paths(law_name)
+    if not os.path.exists(result_path) or not os.path.exists(state_path):
+        return None, None
+    with open(state_path, "r") as f:
+        state = json.load(f)
+    return load_results(result_path), state
+
+
+def save_incremental_state(law_name, result_df, state):
+    state_dir, result_path, state_path = _state_paths(law_name)
+    os.makedirs(state_dir, exist_ok=True)
+    save_results(result_df, result_path)
+    tmp_path = temp_path(state_path)
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, state_path)
+
+
+def _pair_key(section, sentiment):
+    return f"{section}|{sentiment}"
+
+
+def clause_sentiment_counts(df):
+    """{"<clause>|<sentiment>": count} over linked comments with a sentiment label."""
+    df = df[(df['Sentiment_Label'] != "N/A") & (df['Linked_Clause'] != IRRELEVANT)]
+    counts = df.groupby(['Linked_Clause', 'Sentiment_Label'], observed=True).size()
+    return {_pair_key(section, sentiment): int(n) for (section, sentiment), n in counts.items()}
+
+
+def update_counts(counts, added, removed):
+    """
+    Applies the counts of added / removed result rows to `counts` in place,
+    dropping empty pairs. Either frame may be None when there is nothing to apply.
+    """
+    for key, n in (clause_sentiment_counts(added) if added is not None and len(added) else {}).items():
+        counts[key] = counts.get(key, 0) + n
+    for key, n in (clause_sentiment_counts(removed) if removed is not None and len(removed) else {}).items():
+        counts[key] = counts.get(key, 0) - n
+        if counts[key] <= 0:
+            del counts[key]
+    return counts
+
+
+def stale_insight_pairs(counts, insight_counts, threshold=INSIGHT_REFRESH_THRESHOLD):
+    """Clause/sentiment pairs whose count moved by more than `threshold` since their insight was written."""
+    stale = []
+    for key, n in counts.items():
+        sentiment = key.rsplit("|", 1)[1]
+        if sentiment not in INSIGHT_SENTIMENTS:
+            continue
+        previous = insight_counts.get(key)
+        if previous is None or abs(n - previous) > threshold * previous:
+            stale.append(key)
+    return stale
+
+
+def diff_comments(new_df, stored_df):
+    """
+    Splits the new file against the stored result by (User_ID, text hash).
+    Returns (delta_df, kept_df, removed_df): rows to process, stored rows that
+    are still current, and stored rows that were deleted or edited.
+    """
+    new_keys = pd.MultiIndex.from_arrays([new_df['User_ID'], new_df['Row_Hash']])
+    stored_keys = pd.MultiIndex.from_arrays([stored_df['User_ID'], stored_df['Row_Hash']])
+    delta_df = new_df[~new_keys.isin(stored_keys)]
+    still_present = stored_keys.isin(new_keys)
+    return delta_df, stored_df[still_present], stored_df[~still_present]
+
+
+def _process_rows(df, law_name):
+    linked_df = link_comments_to_law(df, law_name)
+    if linked_df is None:
+        return None
+    final_df = analyze_sentiment(linked_df, keep_probs=True)
+    if final_df is not None and 'Sentiment_Label' not in final_df.columns:
+        # analyze_sentiment leaves the columns off when nothing was relevant
+        final_df['Sentiment_Label'] = "N/A"
+        final_df['Sentiment_Score'] = 0.0
+    return final_df
+
+
+def run_incremental(law_name, raw_csv_path, insight_threshold=INSIGHT_REFRESH_THRESHOLD, refresh_insights=True):
+    """
+    Links and scores only the comments that are new (or edited) since the last
+    run for this law, merges them into the stored result and updates the
+    clause x sentiment counts in place. Insights are regenerated only for pairs
+    whose counts moved by more than `insight_threshold`.
+    Returns (result_df, state), or (None, None) on failure.
+    """
+    if not os.path.exists(raw_csv_path):
+        print(f"Error: Could not find input file at {raw_csv_path}")
+        return None, None
+
+    new_df = pd.read_csv(raw_csv_path)
+    if 'User_ID' not in new_df.columns or 'Comment' not in new_df.columns:
+        print("Error: Incremental mode needs 'User_ID' and 'Comment' columns.")
+        return None, None
+    new_df['Row_Hash'] = [row_hash(c) for c in new_df['Comment']]
+
+    law_clauses = get_law_clauses(law_name)
+    if not law_clauses:
+        print("Error: No law context available.")
+        return None, None
+    ensure_law_pack(law_name, law_clauses)
+    config = _config_key(law_clauses)
+
+    stored_df, state = load_incremental_state(law_name)
+    if stored_df is not None and state.get("config") != config:
+        print("Law context or model configuration changed since the last run, rebuilding from scratch.")
+        stored_df, state = None, None
+
+    start = time.perf_counter()
+    if stored_df is None:
+        delta_df, kept_df, removed_df = new_df, new_df.iloc[:0], None
+        state = {"config": config, "counts": {}, "insight_counts": {}, "insights": {}}
+    else:
+        delta_df, kept_df, removed_df = diff_comments(new_df, stored_df)
+    n_removed = 0 if removed_df is None else len(removed_df)
+    print(f"Incremental run: {len(delta_df)} new/changed, {len(kept_df)} unchanged, {n_removed} removed comments.")
+
+    # Only processed rows carry the result columns the counts are built from
+    added_df = None
+    if len(delta_df):
+        added_df = _process_rows(delta_df.copy(), law_name)
+        if added_df is None:
+            return None, None
+        # Concatenating categoricals with different categories falls back to object dtype
+        result_df = compact_results(pd.concat([kept_df, added_df], ignore_index=True))
+    else:
+        result_df = kept_df.reset_index(drop=True)
+
+    update_counts(state["counts"], added_df, removed_df)
+    print(f"Linked and scored the delta in {time.perf_counter() - start:.1f}s")
+
+    if refresh_insights:
+        refresh_stale_insights(result_df, state, law_name, insight_threshold)
+
+    save_incremental_state(law_name, result_df, state)
+    return result_df, state
+
+
+def refresh_stale_insights(result_df, state, law_name, threshold=INSIGHT_REFRESH_THRESHOLD):
+    """Regenerates insights for the stale pairs only; failed ones stay stale for the next run."""
+    # Imported here: the scheduler pulls in the async Groq client
+    from src.insight_scheduler import generate_insights
+
+    counts = state["counts"]
+    # Pairs that no longer have any comments lose their insight
+    for key in list(state["insights"]):
+        if key not in counts:
+            del state["insights"][key]
+            state["insight_counts"].pop(key, None)
+
+    stale = stale_insight_pairs(counts, state["insight_counts"], threshold)
+    print(f"Insights: {len(stale)} of {len(counts)} clause/sentiment pairs moved past the threshold.")
+    if not stale:
+        return
+
+    df = result_df[(result_df['Sentiment_Label'] != "N/A") & (result_df['Linked_Clause'] != IRRELEVANT)]
+    token_stats = {}
+    tasks = []
+    for key in stale:
+        section, sentiment = key.rsplit("|", 1)
+        tasks.append((section, sentiment, select_insight_comments(df, section, sentiment, token_stats)))
+    log_token_savings(token_stats)
+
+    for (section, sentiment), insight in generate_insights(tasks, law_name).items():
+        if insight_failed(insight):
+            continue
+        key = _pair_key(section, sentiment)
+        state["insights"][key] = insight
+        state["insight_counts"][key] = counts[key]
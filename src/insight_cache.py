@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.law_pack import law_slug
+
+INSIGHT_CACHE_PATH = os.path.join("data", "cache", "insights.sqlite")
+INSIGHT_CACHE_TTL_DAYS = float(os.getenv("POLICYIQ_INSIGHT_TTL_DAYS", 30))
+INSIGHT_CACHE_MAX_ENTRIES = 5000
+
+
+def insight_cache_key(law_name, section, sentiment, model, prompt_version, comments):
+    """Everything that determines an insight: law, clause, sentiment, model, prompt and comment set."""
+    # Order-insensitive fingerprint of the comments that went into the prompt
+    fingerprint = hashlib.sha256("\x00".join(sorted(comments)).encode("utf-8")).hexdigest()
+    payload = json.dumps([law_slug(law_name), section, sentiment, model, prompt_version, fingerprint])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    """Persistent insight store with a TTL and least-recently-used eviction past max_entries."""
+
+    def __init__(self, path=INSIGHT_CACHE_PATH, ttl_days=INSIGHT_CACHE_TTL_DAYS, max_entries=INSIGHT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS insights "
+            "(key TEXT PRIMARY KEY, insight TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT insight, created_at FROM insights WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM insights WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE insights SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, insight):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO insights (key, insight, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, insight, now, now),
+            )
+            self._conn.execute("DELETE FROM insights WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM insights WHERE key IN "
+                "(SELECT key FROM insights ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
@@ -1,30 +1,40 @@
+import json
 import pandas as pd
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-from groq import Groq
+from src.comment_selector import select_representatives
+from src.groq_client import GROQ_MODEL, estimate_tokens, get_groq_client
+from src.insight_cache import InsightCache, insight_cache_key
+from src.model_registry import cache_resource
+from src.results_store import RESULT_PATH, load_results
 
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(env_path)
-
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("GROQ_API_KEY not found!")
+CONFIDENCE_THRESHOLD = 0.65 
+MAX_PROMPT_COMMENTS = 15
+INSIGHT_MAX_TOKENS = 100
+INSIGHT_SYSTEM_PROMPT = "You are a concise legal data analyst."
+NO_COMMENTS_INSIGHT = "No comments available to analyze."
+# Bump whenever build_insight_prompt or INSIGHT_SYSTEM_PROMPT changes, so cached insights are regenerated
+INSIGHT_PROMPT_VERSION = 1
+# Same, for build_batch_insight_prompt
+BATCH_INSIGHT_PROMPT_VERSION = 1
+# Multi-clause mode: pack several clauses into one JSON-mode request
+BATCH_INSIGHTS = os.getenv("POLICYIQ_BATCH_INSIGHTS", "0") == "1"
+# Prompt + output tokens per batched request, well inside the model's context window
+BATCH_CONTEXT_TOKENS = 6000
+BATCH_MAX_CLAUSES = 12
+BATCH_TOKENS_PER_INSIGHT = 80
 
-client = Groq(api_key=api_key)
+@cache_resource
+def get_insight_cache():
+    return InsightCache()
 
-CONFIDENCE_THRESHOLD = 0.65 
+def cached_insight_key(comments, law_name, section_name, sentiment_type, batched=False):
+    prompt_version = f"batch-{BATCH_INSIGHT_PROMPT_VERSION}" if batched else INSIGHT_PROMPT_VERSION
+    return insight_cache_key(law_name, section_name, sentiment_type, GROQ_MODEL, prompt_version, comments[:MAX_PROMPT_COMMENTS])
 
-def get_groq_insight(comments, law_name, section_name, sentiment_type):
-    """
-    Sends the comments to Groq (Llama-3) for an instant 1-sentence summary.
-    """
-    if not comments:
-        return "No comments available to analyze."
-    
-    comments_text = "\n- ".join(comments[:15])
+def build_insight_prompt(comments, law_name, section_name, sentiment_type):
+    comments_text = "\n- ".join(comments[:MAX_PROMPT_COMMENTS])
     
-    prompt = f"""
+    return f"""
     You are a legal analyst. Here are some user comments regarding '{section_name}' of the law: "{law_name}".
     The general sentiment is {sentiment_type.upper()}.
     
@@ -37,58 +47,179 @@ def get_groq_insight(comments, law_name, section_name, sentiment_type):
     Do not mention individual users.
     """
 
+def build_batch_insight_prompt(items, law_name):
+    """`items` is a list of (item_id, section, sentiment, comments)."""
+    groups = "\n\n    ".join(
+        f'GROUP "{item_id}" ({section}, sentiment {sentiment.upper()}):\n    - ' + "\n    - ".join(comments[:MAX_PROMPT_COMMENTS])
+        for item_id, section, sentiment, comments in items
+    )
+
+    return f"""
+    You are a legal analyst. Here are groups of user comments on the law: "{law_name}".
+    Each group is about one section and shares one sentiment.
+    
+    {groups}
+    
+    TASK:
+    For EACH group, summarize the MAIN REASON for its sentiment in exactly one clear, professional sentence.
+    Start with "Citizens feel..." or "The opposition is due to..." or "Support is driven by..."
+    Do not mention individual users.
+    Output strictly as a JSON object with a single key "insights" mapping every group ID to its sentence.
+    """
+
+def batch_max_tokens(n_items):
+    return BATCH_TOKENS_PER_INSIGHT * n_items + 20
+
+def split_insight_batches(items, law_name):
+    """Greedily packs items into batches that fit BATCH_CONTEXT_TOKENS and BATCH_MAX_CLAUSES."""
+    batches = []
+    current = []
+    for item in items:
+        candidate = current + [item]
+        cost = estimate_tokens(INSIGHT_SYSTEM_PROMPT + build_batch_insight_prompt(candidate, law_name)) + batch_max_tokens(len(candidate))
+        if current and (cost > BATCH_CONTEXT_TOKENS or len(candidate) > BATCH_MAX_CLAUSES):
+            batches.append(current)
+            current = [item]
+        else:
+            current = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_insights(response_text):
+    """Returns {item_id: insight} from a batched JSON response, skipping malformed entries."""
+    try:
+        insights = json.loads(response_text).get("insights", {})
+    except (ValueError, AttributeError):
+        return {}
+    if not isinstance(insights, dict):
+        return {}
+    return {str(k): v.strip() for k, v in insights.items() if isinstance(v, str) and v.strip()}
+
+def get_groq_insight(comments, law_name, section_name, sentiment_type):
+    """
+    Sends the comments to Groq (Llama-3) for an instant 1-sentence summary.
+    """
+    if not comments:
+        return NO_COMMENTS_INSIGHT
+
+    cache_key = cached_insight_key(comments, law_name, section_name, sentiment_type)
+    cached = get_insight_cache().get(cache_key)
+    if cached is not None:
+        return cached
+    
+    prompt = build_insight_prompt(comments, law_name, section_name, sentiment_type)
+
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        response = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL,
             messages=[
-                {"role": "system", "content": "You are a concise legal data analyst."},
+                {"role": "system", "content": INSIGHT_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.2,
-            max_tokens=100,
+            max_tokens=INSIGHT_MAX_TOKENS,
         )
         if not response.choices or not response.choices[0].message.content:
             return "Could not generate insight due to empty response."
-        return response.choices[0].message.content.strip()
+        insight = response.choices[0].message.content.strip()
+        get_insight_cache().put(cache_key, insight)
+        return insight
     except Exception as e:
         return f"Could not generate insight due to API Error: {e}"
 
-def analyze_insights(csv_path, law_name):
+def select_insight_comments(df, section, sentiment, token_stats=None):
+    """
+    A diverse, representative set of high-confidence comments for one clause and
+    sentiment (all comments are candidates if none clear the bar).
+    token_stats, if given, accumulates prompt tokens vs. the old first-15 selection.
+    """
+    in_group = (df['Linked_Clause'] == section) & (df['Sentiment_Label'] == sentiment)
+    group = df[in_group & (df['Sentiment_Score'] > CONFIDENCE_THRESHOLD)]
+    if group.empty:
+        group = df[in_group]
+    comments = group['Comment'].astype(str).tolist()
+    if not comments:
+        return []
+
+    # Imported here so the insight engine doesn't load the linker until it is needed;
+    # the linker already encoded these comments, so this is mostly cache hits
+    from src.linker import encode_comments
+    selected = select_representatives(comments, encode_comments(comments), group['Sentiment_Score'].to_numpy())
+
+    if token_stats is not None:
+        token_stats['baseline'] = token_stats.get('baseline', 0) + estimate_tokens("\n- ".join(comments[:MAX_PROMPT_COMMENTS]))
+        token_stats['selected'] = token_stats.get('selected', 0) + estimate_tokens("\n- ".join(selected))
+    return selected
+
+def log_token_savings(token_stats):
+    baseline, selected = token_stats.get('baseline', 0), token_stats.get('selected', 0)
+    if baseline:
+        print(f"Insight prompt comments: ~{selected} tokens vs ~{baseline} with the first {MAX_PROMPT_COMMENTS} "
+              f"({1 - selected / baseline:.0%} saved)")
+
+def insight_pairs(df, sentiments=("negative", "neutral", "positive")):
+    """Every (section, sentiment) pair that has comments; cheap, no comment selection."""
+    df = df[(df['Sentiment_Label'] != "N/A") & (df['Linked_Clause'] != "Irrelevant")]
+    counts = df.groupby(['Linked_Clause', 'Sentiment_Label'], observed=True).size()
+    return [(section, sentiment) for (section, sentiment), count in counts.items() if sentiment in sentiments and count > 0]
+
+def insight_failed(text):
+    return str(text).startswith("Could not generate insight")
+
+def collect_insight_tasks(df, sentiments=("negative", "neutral", "positive"), pairs=None):
+    """
+    One (section, sentiment, comments) task for every clause/sentiment pair that
+    has comments, or only for `pairs` if given.
+    """
+    if pairs is None:
+        pairs = insight_pairs(df, sentiments)
+    df = df[(df['Sentiment_Label'] != "N/A") & (df['Linked_Clause'] != "Irrelevant")]
+    tasks = []
+    token_stats = {}
+    for section, sentiment in pairs:
+        tasks.append((section, sentiment, select_insight_comments(df, section, sentiment, token_stats)))
+    log_token_savings(token_stats)
+    return tasks
+
+def insights_complete(insights):
+    """False if any insight, per-clause ones included, is an error placeholder."""
+    texts = [v for k, v in insights.items() if k != 'clauses'] + list(insights.get('clauses', {}).values())
+    return not any(insight_failed(text) for text in texts)
+
+def analyze_insights(results, law_name, all_clauses=False, batched=BATCH_INSIGHTS):
+    """`results` is the result DataFrame itself, or a path to a .parquet / .csv result file."""
     print(f"Groq Insight Engine Running for: {law_name}...")
     
-    if not os.path.exists(csv_path):
-        print(f"Error: File not found at {csv_path}")
+    if isinstance(results, pd.DataFrame):
+        df = results
+    elif not os.path.exists(results):
+        print(f"Error: File not found at {results}")
         return
-    
-    df = pd.read_csv(csv_path)
+    else:
+        df = load_results(results)
     df = df[df['Sentiment_Label'] != "N/A"]
     if df.empty: 
         print("No valid data found in CSV.")
         return
 
-    summary = df.groupby(['Linked_Clause', 'Sentiment_Label']).size().unstack(fill_value=0)
+    summary = df.groupby(['Linked_Clause', 'Sentiment_Label'], observed=True).size().unstack(fill_value=0)
     for col in ['negative', 'positive']:
         if col not in summary.columns: summary[col] = 0
 
     print("\n --- GENERATIVE INSIGHT REPORT ---")
+    token_stats = {}
+    insights = {}
 
     if summary['negative'].sum() > 0:
         target_section = summary['negative'].idxmax()
         count = summary['negative'].max()
         
-        angry_comments = df[
-            (df['Linked_Clause'] == target_section) & 
-            (df['Sentiment_Label'] == 'negative') &
-            (df['Sentiment_Score'] > CONFIDENCE_THRESHOLD)
-        ]['Comment'].tolist()
-        
-        if not angry_comments:
-            angry_comments = df[
-                (df['Linked_Clause'] == target_section) & 
-                (df['Sentiment_Label'] == 'negative')
-            ]['Comment'].tolist()
+        angry_comments = select_insight_comments(df, target_section, 'negative', token_stats)
         
         insight = get_groq_insight(angry_comments, law_name, target_section, "negative")
+        insights['opposed_sec'] = target_section
+        insights['opposed_text'] = insight
         
         print(f"   • Volume: {count} negative comments")
         print(f"   • Insight: {insight}")
@@ -97,26 +228,32 @@ def analyze_insights(csv_path, law_name):
         target_section = summary['positive'].idxmax()
         count = summary['positive'].max()
         
-        happy_comments = df[
-            (df['Linked_Clause'] == target_section) & 
-            (df['Sentiment_Label'] == 'positive') &
-            (df['Sentiment_Score'] > CONFIDENCE_THRESHOLD)
-        ]['Comment'].tolist()
-        
-        if not happy_comments:
-            happy_comments = df[
-                (df['Linked_Clause'] == target_section) & 
-                (df['Sentiment_Label'] == 'positive')
-            ]['Comment'].tolist()
+        happy_comments = select_insight_comments(df, target_section, 'positive', token_stats)
         
         insight = get_groq_insight(happy_comments, law_name, target_section, "positive")
+        insights['supported_sec'] = target_section
+        insights['supported_text'] = insight
         
         print(f"   • Volume: {count} positive comments")
         print(f"   • Insight: {insight}")
 
+    log_token_savings(token_stats)
+
+    if all_clauses:
+        # Imported here: the scheduler module imports this one
+        from src.insight_scheduler import generate_insights
+
+        print("\n --- EVERY CLAUSE ---")
+        insights['clauses'] = generate_insights(
+            collect_insight_tasks(df), law_name,
+            on_result=lambda section, sentiment, insight: print(f"   • {section} [{sentiment}]: {insight}"),
+            batched=batched,
+        )
+
+    return insights
+
 def run_insight_engine(law_name):
-    input_file = os.path.join("data", "processed", "sentiment_analysis_result.csv")
-    analyze_insights(input_file, law_name)
+    analyze_insights(RESULT_PATH, law_name)
 
 if __name__ == "__main__":
     law_name = input("Enter the name of the law for insight generation: ")
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import random
+import time
+from src.groq_client import GROQ_MODEL, create_async_groq_client, estimate_tokens
+from src.insight_engine import (
+    BATCH_INSIGHTS, INSIGHT_MAX_TOKENS, INSIGHT_SYSTEM_PROMPT, NO_COMMENTS_INSIGHT,
+    batch_max_tokens, build_batch_insight_prompt, build_insight_prompt, cached_insight_key,
+    get_insight_cache, parse_batch_insights, split_insight_batches,
+)
+
+# Provider limits for GROQ_MODEL; set these to your account's tier
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", 30))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", 12000))
+MAX_CONCURRENT_INSIGHTS = 4
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Async token bucket holding up to `per_minute` units, refilled continuously."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket would wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+async def _request_insight(client, limiters, semaphore, prompt, max_tokens=INSIGHT_MAX_TOKENS, json_output=False):
+    request_bucket, token_bucket = limiters
+    extra = {"response_format": {"type": "json_object"}} if json_output else {}
+    last_error = None
+    for attempt in range(MAX_RETRIES + 1):
+        async with semaphore:
+            await request_bucket.acquire()
+            await token_bucket.acquire(estimate_tokens(INSIGHT_SYSTEM_PROMPT + prompt) + max_tokens)
+            try:
+                response = await client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=[
+                        {"role": "system", "content": INSIGHT_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.2,
+                    max_tokens=max_tokens,
+                    **extra,
+                )
+                if not response.choices or not response.choices[0].message.content:
+                    return "Could not generate insight due to empty response.", False
+                return response.choices[0].message.content.strip(), True
+            except Exception as e:
+                last_error = e
+        if attempt < MAX_RETRIES:
+            # Full jitter: spread retries out so they don't hit the limit together again
+            await asyncio.sleep(random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return f"Could not generate insight due to API Error: {last_error}", False
+
+
+async def iter_insights(tasks, law_name, batched=BATCH_INSIGHTS):
+    """
+    Async generator over (section, sentiment, insight) in completion order.
+    `tasks` is a list of (section, sentiment, comments), e.g. from collect_insight_tasks.
+    With batched, several clauses share one JSON-mode request (build_batch_insight_prompt),
+    packed by split_insight_batches.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_INSIGHTS)
+    limiters = (TokenBucket(GROQ_REQUESTS_PER_MINUTE), TokenBucket(GROQ_TOKENS_PER_MINUTE))
+    insight_cache = get_insight_cache()
+
+    # Unchanged clauses are answered from the insight cache and never reach the network
+    to_request = []
+    for section, sentiment, comments in tasks:
+        if not comments:
+            yield section, sentiment, NO_COMMENTS_INSIGHT
+            continue
+        cache_key = cached_insight_key(comments, law_name, section, sentiment, batched=batched)
+        cached = insight_cache.get(cache_key)
+        if cached is not None:
+            yield section, sentiment, cached
+        else:
+            to_request.append((section, sentiment, comments, cache_key))
+    print(f"Insight cache: {len(tasks) - len(to_request)}/{len(tasks)} hits, requesting {len(to_request)}")
+    if not to_request:
+        return
+
+    async with create_async_groq_client() as client:
+        async def run(section, sentiment, comments, cache_key):
+            prompt = build_insight_prompt(comments, law_name, section, sentiment)
+            insight, ok = await _request_insight(client, limiters, semaphore, prompt)
+            if ok:
+                insight_cache.put(cache_key, insight)
+            return section, sentiment, insight
+
+        async def run_batch(batch):
+            prompt = build_batch_insight_prompt([item[:4] for item in batch], law_name)
+            response_text, ok = await _request_insight(
+                client, limiters, semaphore, prompt, max_tokens=batch_max_tokens(len(batch)), json_output=True
+            )
+            batch_insights = parse_batch_insights(response_text) if ok else {}
+            error = "missing from batched response" if ok else response_text
+            results = []
+            for item_id, section, sentiment, _, cache_key in batch:
+                insight = batch_insights.get(item_id)
+                if insight is None:
+                    results.append((section, sentiment, f"Could not generate insight due to {error}."))
+                else:
+                    insight_cache.put(cache_key, insight)
+                    results.append((section, sentiment, insight))
+            return results
+
+        if batched:
+            items = [(str(i + 1),) + task for i, task in enumerate(to_request)]
+            by_id = {item[0]: item for item in items}
+            batches = split_insight_batches([item[:4] for item in items], law_name)
+            print(f"Packing {len(items)} insights into {len(batches)} batched requests")
+            pending = [asyncio.create_task(run_batch([by_id[b[0]] for b in batch])) for batch in batches]
+            for finished in asyncio.as_completed(pending):
+                for result in await finished:
+                    yield result
+        else:
+            pending = [asyncio.create_task(run(*task)) for task in to_request]
+            for finished in asyncio.as_completed(pending):
+                yield await finished
+
+
+def generate_insights(tasks, law_name, on_result=None, batched=BATCH_INSIGHTS):
+    """
+    Runs every insight task concurrently under the rate limits and returns
+    {(section, sentiment): insight}. on_result(section, sentiment, insight) is
+    called as each one completes, so callers can show results progressively.
+    """
+    async def collect():
+        results = {}
+        async for section, sentiment, insight in iter_insights(tasks, law_name, batched):
+            results[(section, sentiment)] = insight
+            if on_result is not None:
+                on_result(section, sentiment, insight)
+        return results
+
+    start = time.perf_counter()
+    results = asyncio.run(collect())
+    print(f"Generated {len(results)} insights in {time.perf_counter() - start:.1f}s")
+    return results
@@ -1,22 +1,23 @@
 import os
 import json
-from pathlib import Path
-from dotenv import load_dotenv
-from groq import Groq
+import threading
+import time
+from src.groq_client import GROQ_MODEL, get_groq_client
+from src.law_pack import law_pack_mtime, law_slug, load_law_pack, temp_path
 
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(env_path) 
+LAW_CACHE_DIR = os.path.join("data", "cache", "law_context")
+LAW_CONTEXT_PATH = os.path.join("data", "processed", "law_context.json")
+LAW_CACHE_TTL_DAYS = float(os.getenv("POLICYIQ_LAW_TTL_DAYS", 30))
 
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    raise ValueError("GROQ_API_KEY not found")
+# One lock per normalized law name: concurrent sessions asking for the same law
+# wait for a single in-flight Groq request instead of each sending their own
+_inflight_locks = {}
+_inflight_guard = threading.Lock()
 
-client = Groq(api_key=api_key)
+LAW_SYSTEM_PROMPT = "You are a legal data extraction assistant. You must output strictly in JSON format."
 
-def fetch_law_summary(law: str):
-    print(f"Fetching summary for law: {law} using Groq...")
-
-    prompt = f"""
+def build_law_prompt(law):
+    return f"""
     I need a structured database of the "Sections" of the law: "{law}".
     
     Rules:
@@ -45,12 +46,15 @@ def fetch_law_summary(law: str):
     }}
     """
 
+def fetch_law_summary(law: str):
+    print(f"Fetching summary for law: {law} using Groq...")
+
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile", 
+        response = get_groq_client().chat.completions.create(
+            model=GROQ_MODEL, 
             messages=[
-                {"role": "system", "content": "You are a legal data extraction assistant. You must output strictly in JSON format."},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": LAW_SYSTEM_PROMPT},
+                {"role": "user", "content": build_law_prompt(law)}
             ],
             response_format={"type": "json_object"},
             temperature=0.2,
@@ -71,18 +75,243 @@ def fetch_law_summary(law: str):
     except Exception as e:
         print(f"Error talking to Groq: {e}")
         return None
-    
-def store_law_summary(law_name):
-    law_data = fetch_law_summary(law_name)
-    if not law_data:    
+
+def iter_json_array_items(chunks, key):
+    """
+    Incremental parser for a streamed JSON object: yields each object of the
+    array under `key` as soon as its closing brace has arrived. Raises
+    ValueError if the chunks run out before the array is closed.
+    """
+    marker = f'"{key}"'
+    buffer = ""
+    pos = 0
+    in_array = False
+    in_string = False
+    escape = False
+    depth = 0
+    start = None
+    for chunk in chunks:
+        buffer += chunk
+        if not in_array:
+            at = buffer.find(marker)
+            bracket = buffer.find("[", at + len(marker)) if at != -1 else -1
+            if bracket == -1:
+                continue
+            in_array = True
+            pos = bracket + 1
+
+        while pos < len(buffer):
+            ch = buffer[pos]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                if depth == 0:
+                    start = pos
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    yield json.loads(buffer[start : pos + 1])
+                    # Drop what has been parsed so the buffer stays one item long
+                    buffer = buffer[pos + 1 :]
+                    pos = 0
+                    continue
+            elif ch == "]" and depth == 0:
+                return
+            pos += 1
+    raise ValueError(f'Stream ended before the "{key}" array was closed.')
+
+def stream_law_summary(law: str):
+    """
+    Streaming variant of fetch_law_summary: yields each clause as soon as the
+    model has finished writing it. Raises on API errors and on a response that
+    was cut off (e.g. finish_reason "length"), after the clauses parsed so far.
+    """
+    print(f"Streaming summary for law: {law} using Groq...")
+    # Groq's JSON mode can't be combined with streaming, so the prompt alone asks for JSON
+    stream = get_groq_client().chat.completions.create(
+        model=GROQ_MODEL,
+        messages=[
+            {"role": "system", "content": LAW_SYSTEM_PROMPT},
+            {"role": "user", "content": build_law_prompt(law)}
+        ],
+        temperature=0.2,
+        max_tokens=8000,
+        stream=True,
+    )
+    finish = {}
+
+    def chunks():
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason:
+                finish["reason"] = chunk.choices[0].finish_reason
+            yield chunk.choices[0].delta.content or ""
+
+    content = chunks()
+    for clause in iter_json_array_items(content, "sections"):
+        if isinstance(clause, dict) and clause.get("clause_id") and clause.get("summary"):
+            yield clause
+    # Drain the rest of the stream so finish_reason is seen
+    for _ in content:
+        pass
+    if finish.get("reason") not in (None, "stop"):
+        raise RuntimeError(f"Law summary stream ended with finish_reason={finish['reason']!r}.")
+
+def _law_cache_path(law):
+    return os.path.join(LAW_CACHE_DIR, f"{law_slug(law)}.json")
+
+def _read_cached_law(law):
+    """Returns (clauses, fetched_at) from the law cache, falling back to an existing law pack."""
+    path = _law_cache_path(law)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            entry = json.load(f)
+        return entry["clauses"], entry["fetched_at"]
+    pack = load_law_pack(law)
+    if pack is not None:
+        return pack['clauses'], law_pack_mtime(law)
+    return None, None
+
+def write_law_context(law_data, path=LAW_CONTEXT_PATH):
+    """Atomically replaces law_context.json; the temp name is per process so concurrent writers don't collide."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(law_data, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _write_cached_law(law, clauses):
+    os.makedirs(LAW_CACHE_DIR, exist_ok=True)
+    path = _law_cache_path(law)
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump({"law_name": law, "fetched_at": time.time(), "clauses": clauses}, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _is_fresh(fetched_at):
+    return fetched_at is not None and time.time() - fetched_at < LAW_CACHE_TTL_DAYS * 86400
+
+def _law_lock(law):
+    with _inflight_guard:
+        return _inflight_locks.setdefault(law_slug(law), threading.Lock())
+
+def get_law_clauses(law: str, refresh=False):
+    """
+    Returns the clause list for a law, keyed by its normalized name.
+    Served from the disk cache (or an existing law pack) while younger than
+    LAW_CACHE_TTL_DAYS; otherwise, or with refresh=True, fetched from Groq.
+    If Groq fails, a stale cached copy is used so known laws still work offline.
+    """
+    if not refresh:
+        clauses, fetched_at = _read_cached_law(law)
+        if clauses and _is_fresh(fetched_at):
+            print(f"Using cached law context for: {law} ({len(clauses)} clauses)")
+            return clauses
+
+    requested_at = time.time()
+    with _law_lock(law):
+        clauses, fetched_at = _read_cached_law(law)
+        # Another session fetched it while we waited on the lock
+        if clauses and fetched_at is not None and fetched_at >= requested_at:
+            return clauses
+
+        fresh_clauses = fetch_law_summary(law)
+        if fresh_clauses:
+            _write_cached_law(law, fresh_clauses)
+            return fresh_clauses
+        if clauses:
+            print(f"Falling back to cached law context for: {law}")
+        return clauses
+
+def stream_law_clauses(law: str, refresh=False, status=None):
+    """
+    Generator version of get_law_clauses. Cached clauses are yielded straight
+    away; otherwise clauses are yielded while Groq is still generating the rest,
+    behind the same per-law lock, so concurrent sessions share one stream and
+    waiters are served from the cache it writes.
+    The cache is only written once the stream completes cleanly. `status`, if
+    given, gets "complete" (False when the stream failed or was cut off, in
+    which case what was yielded is partial) and "fallback" (a stale cached
+    clause list to use instead, if there is one).
+    """
+    status = {} if status is None else status
+    status["complete"], status["fallback"] = False, None
+    cached, fetched_at = _read_cached_law(law)
+    if cached and not refresh and _is_fresh(fetched_at):
+        print(f"Using cached law context for: {law} ({len(cached)} clauses)")
+        status["complete"] = True
+        yield from cached
+        return
+
+    requested_at = time.time()
+    with _law_lock(law):
+        cached, fetched_at = _read_cached_law(law)
+        # Another session streamed it while we waited on the lock
+        if cached and fetched_at is not None and fetched_at >= requested_at:
+            status["complete"] = True
+            yield from cached
+            return
+
+        clauses = []
+        try:
+            for clause in stream_law_summary(law):
+                clauses.append(clause)
+                yield clause
+        except Exception as e:
+            print(f"Error talking to Groq: {e}")
+            if cached:
+                print(f"Falling back to cached law context for: {law}")
+                status["fallback"] = cached
+            return
+
+        print(f"Retrieved {len(clauses)} clauses.")
+        if clauses:
+            _write_cached_law(law, clauses)
+            status["complete"] = True
+        elif cached:
+            print(f"Falling back to cached law context for: {law}")
+            status["fallback"] = cached
+
+def stream_law_context(law_name, refresh=False, comments=None, status=None):
+    """
+    Streams the law's clauses into its law pack (see stream_law_pack) and
+    returns the pack. A partial stream is never saved: the stale cached copy
+    is used if there is one, otherwise None is returned.
+    """
+    from src.linker import ensure_law_pack, stream_law_pack
+    status = {} if status is None else status
+    pack = stream_law_pack(
+        law_name, stream_law_clauses(law_name, refresh=refresh, status=status), comments,
+        complete=lambda: status["complete"],
+    )
+    if pack is None and status.get("fallback"):
+        pack = ensure_law_pack(law_name, status["fallback"])
+    return pack
+
+def store_law_summary(law_name, refresh=False, comments=None, status=None):
+    """
+    Fetches the law context and precompiles its law pack. Clauses are embedded
+    as they stream in, and `comments` (if given) are encoded into the embedding
+    cache at the same time, so linking afterwards is mostly cache hits.
+    `status` is filled in as for stream_law_clauses.
+    """
+    pack = stream_law_context(law_name, refresh=refresh, comments=comments, status=status)
+    if pack is None:
         print("No law data to save.")
         return
-    save_path = os.path.join("data", "processed" , "law_context.json")
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, "w") as f:
-        json.dump(law_data, f, indent=4)
+    law_data = pack['clauses']
+    write_law_context(law_data)
+    return law_data
 
 if __name__ == "__main__":
     law_name = input("Enter the name of the law you want to fetch: ")
-    save_path = os.path.join("data", "processed", "law_context.json")
     store_law_summary(law_name)
\ No newline at end of file
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+
+LAW_PACK_DIR = os.path.join("data", "processed", "law_packs")
+LAW_PACK_VERSION = 1
+
+
+def law_slug(law_name):
+    """Filesystem-safe key for a law name, e.g. 'personal-data-protection-bill-2019'."""
+    return re.sub(r"[^a-z0-9]+", "-", law_name.lower()).strip("-")
+
+
+def temp_path(path):
+    """A temp name next to `path` that is unique per process and thread, for write-then-os.replace."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def clauses_hash(law_clauses):
+    payload = json.dumps(law_clauses, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def law_pack_dir(law_name):
+    return os.path.join(LAW_PACK_DIR, law_slug(law_name))
+
+
+def build_law_pack(law_name, law_clauses, encoder, model_name, embeddings=None):
+    """
+    Writes a law pack: clause list + content hash in pack.json and the
+    normalized clause embedding matrix in embeddings.npy.
+    `encoder` is a SentenceTransformer (or anything with the same encode());
+    it is not used when the clause `embeddings` are passed in already.
+    """
+    pack_dir = law_pack_dir(law_name)
+    os.makedirs(pack_dir, exist_ok=True)
+
+    if embeddings is None:
+        summaries = [c['summary'] for c in law_clauses]
+        embeddings = encoder.encode(summaries, normalize_embeddings=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    meta = {
+        "version": LAW_PACK_VERSION,
+        "law_name": law_name,
+        "model_name": model_name,
+        "content_hash": clauses_hash(law_clauses),
+        "clauses": law_clauses,
+    }
+
+    # Write embeddings first and the manifest last, so a half-written pack is never loaded
+    emb_path = os.path.join(pack_dir, "embeddings.npy")
+    emb_tmp = temp_path(emb_path)
+    with open(emb_tmp, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(emb_tmp, emb_path)
+    meta_tmp = temp_path(os.path.join(pack_dir, "pack.json"))
+    with open(meta_tmp, "w") as f:
+        json.dump(meta, f, indent=4)
+    os.replace(meta_tmp, os.path.join(pack_dir, "pack.json"))
+
+    print(f"Law pack built for '{law_name}' ({len(law_clauses)} clauses).")
+    return load_law_pack(law_name, model_name)
+
+
+def law_pack_mtime(law_name):
+    path = os.path.join(law_pack_dir(law_name), "pack.json")
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def load_law_pack(law_name, model_name=None):
+    """
+    Returns the pack dict with 'embeddings' memory-mapped read-only,
+    or None if there is no valid pack for this law (and model).
+    """
+    pack_dir = law_pack_dir(law_name)
+    meta_path = os.path.join(pack_dir, "pack.json")
+    emb_path = os.path.join(pack_dir, "embeddings.npy")
+    if not os.path.exists(meta_path) or not os.path.exists(emb_path):
+        return None
+
+    with open(meta_path, "r") as f:
+        pack = json.load(f)
+
+    if pack.get("version") != LAW_PACK_VERSION:
+        return None
+    if model_name is not None and pack.get("model_name") != model_name:
+        return None
+    if pack.get("content_hash") != clauses_hash(pack.get("clauses", [])):
+        print(f"Warning: Law pack for '{law_name}' failed its content hash check.")
+        return None
+
+    embeddings = np.load(emb_path, mmap_mode="r")
+    if embeddings.shape[0] != len(pack["clauses"]):
+        return None
+
+    pack["embeddings"] = embeddings
+    return pack
@@ -1,14 +1,101 @@
+import atexit
+import glob
 import json
 import os
-import pandas as pd
-from sentence_transformers import SentenceTransformer
+import threading
 import numpy as np
-import streamlit as st
+from src.backends import INFERENCE_BACKEND, load_sentence_model, model_id
+from src.embedding_cache import EmbeddingCache, text_key
+from src.dedup import collapse_duplicates
+from src.law_pack import build_law_pack, load_law_pack, law_pack_mtime
+from src.model_registry import cache_resource
+from src.model_server import MODEL_SERVER_URL, RemoteEncoder, server_info
 
-@st.cache_resource
-def get_linker_model():
-    print("Loading Linker Model into RAM...")
-    return SentenceTransformer('all-MiniLM-L6-v2')
+LINKER_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Embedding caches and law packs are keyed by this (see get_linker_model_id), so backends never share vectors
+LINKER_MODEL_ID = model_id(LINKER_MODEL_NAME, INFERENCE_BACKEND)
+RELEVANCE_THRESHOLD = 0.25
+IRRELEVANT = "Irrelevant"
+# Multi-process encoding: off by default, and skipped below POOL_MIN_COMMENTS
+# where spawning workers costs more than it saves
+USE_ENCODE_POOL = os.getenv("POLICYIQ_ENCODE_POOL", "0") == "1"
+POOL_WORKERS = int(os.getenv("POLICYIQ_POOL_WORKERS", os.cpu_count() or 1))
+POOL_MIN_COMMENTS = 2000
+POOL_CHUNK_SIZE = 1000
+
+@cache_resource
+def get_linker_model(backend=INFERENCE_BACKEND):
+    if MODEL_SERVER_URL:
+        print(f"Using Linker Model on model server {MODEL_SERVER_URL}")
+        return RemoteEncoder()
+    print(f"Loading Linker Model ({backend}) into RAM...")
+    return load_sentence_model(LINKER_MODEL_NAME, backend)
+
+def get_linker_model_id():
+    """The id embeddings and law packs are stored under: the server's model when a model server is used."""
+    if MODEL_SERVER_URL:
+        return server_info()["linker"]["model_id"]
+    return LINKER_MODEL_ID
+
+@cache_resource
+def get_embedding_cache():
+    dim = get_linker_model().get_sentence_embedding_dimension()
+    return EmbeddingCache(get_linker_model_id(), dim)
+
+def merge_embedding_spills():
+    """
+    Merges the embeddings that read-only processes (e.g. batch workers) spilled
+    into the shared cache. Only call this once those processes have exited.
+    """
+    probe_dir = EmbeddingCache.cache_dir_for(get_linker_model_id())
+    if not glob.glob(os.path.join(probe_dir, "spill-*.npz")):
+        return 0
+    dim = get_linker_model().get_sentence_embedding_dimension()
+    merged = EmbeddingCache(get_linker_model_id(), dim, read_only=False).merge_spills()
+    print(f"Merged {merged} spilled embeddings into the embedding cache.")
+    return merged
+
+@cache_resource
+def get_encode_pool():
+    """Worker processes each holding a copy of MiniLM; kept alive for the life of the process."""
+    linker_model = get_linker_model()
+    print(f"Starting encode pool with {POOL_WORKERS} workers...")
+    pool = linker_model.start_multi_process_pool(["cpu"] * POOL_WORKERS)
+    atexit.register(linker_model.stop_multi_process_pool, pool)
+    return pool
+
+def encode_comments(comments_list, batch_size=64, use_pool=None, flush=True):
+    """
+    Encodes comments with MiniLM, reading from and filling the on-disk embedding cache.
+    Only cache misses are sent to the model, sharded across the encode pool
+    when it is enabled and there are enough of them.
+    Callers encoding in a loop pass flush=False and flush the cache once at the end.
+    """
+    if use_pool is None:
+        use_pool = USE_ENCODE_POOL
+    cache = get_embedding_cache()
+    model_id = get_linker_model_id()
+    keys = [text_key(c, model_id) for c in comments_list]
+    comment_vectors, hits = cache.get_many(keys)
+
+    miss_idx = np.flatnonzero(~hits)
+    print(f"Embedding cache: {int(hits.sum())}/{len(keys)} hits, encoding {len(miss_idx)} comments...")
+    if len(miss_idx):
+        linker_model = get_linker_model()
+        miss_texts = [comments_list[i] for i in miss_idx]
+        if use_pool and not MODEL_SERVER_URL and POOL_WORKERS > 1 and len(miss_texts) >= POOL_MIN_COMMENTS:
+            miss_vectors = linker_model.encode(
+                miss_texts, pool=get_encode_pool(), chunk_size=POOL_CHUNK_SIZE,
+                batch_size=batch_size, normalize_embeddings=True,
+            )
+        else:
+            miss_vectors = linker_model.encode(miss_texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=True)
+        comment_vectors[miss_idx] = miss_vectors
+        cache.put_many([keys[i] for i in miss_idx], miss_vectors)
+        if flush:
+            cache.flush()
+
+    return comment_vectors
 
 def load_law_context():
     path = os.path.join("data", "processed", "law_context.json")
@@ -18,48 +105,183 @@ def load_law_context():
     with open(path, 'r') as f:
         return json.load(f)
 
-def link_comments_to_law(input_df):
+@cache_resource
+def _load_cached_law_pack(law_name, mtime):
+    # mtime is part of the cache key so a rebuilt pack is picked up
+    return load_law_pack(law_name, get_linker_model_id())
+
+def get_law_pack(law_name):
+    mtime = law_pack_mtime(law_name)
+    if mtime is None:
+        return None
+    return _load_cached_law_pack(law_name, mtime)
+
+def ensure_law_pack(law_name, law_clauses):
+    """Returns the law pack for these clauses, rebuilding it if the clauses changed."""
+    pack = get_law_pack(law_name)
+    if pack is not None and pack['clauses'] == law_clauses:
+        return pack
+    build_law_pack(law_name, law_clauses, get_linker_model(), get_linker_model_id())
+    return get_law_pack(law_name)
+
+def stream_law_pack(law_name, clause_stream, comments=None, complete=None):
     """
-    Input: A Pandas DataFrame containing a 'Comment' column.
-    Output: The same DataFrame with new columns added.
+    Builds the law pack while the clauses are still arriving: each clause is
+    embedded as soon as it is yielded by `clause_stream`, unless the existing
+    pack already holds it, in which case its stored vector is reused (so a
+    pack served from the law cache costs no encoding at all). If `comments` are
+    given, they are encoded into the embedding cache on a background thread
+    at the same time, so the fetch overlaps the comment encoding.
+    complete(), if given, is checked once the stream is exhausted; a partial
+    stream is not saved as a pack.
+    Returns the pack, or None if no (complete) clause list arrived.
     """
-    linker_model = get_linker_model()
+    comment_thread = None
+    if comments is not None:
+        unique_comments, _ = collapse_duplicates(list(comments), "casefold")
+        comment_thread = threading.Thread(target=encode_comments, args=(unique_comments,), daemon=True)
+        comment_thread.start()
 
-    law_clauses = load_law_context()
-    if not law_clauses: 
+    pack = get_law_pack(law_name)
+    known_rows = {c['summary']: i for i, c in enumerate(pack['clauses'])} if pack is not None else {}
+    law_clauses = []
+    clause_vectors = []
+    n_reused = 0
+    for clause in clause_stream:
+        law_clauses.append(clause)
+        row = known_rows.get(clause['summary'])
+        if row is not None:
+            clause_vectors.append(pack['embeddings'][row])
+            n_reused += 1
+            continue
+        clause_vectors.append(get_linker_model().encode([clause['summary']], normalize_embeddings=True)[0])
+        print(f"   Embedded {clause['clause_id']} ({len(law_clauses)} so far)")
+    if n_reused:
+        print(f"   Reused {n_reused}/{len(law_clauses)} clause embeddings from the existing law pack")
+
+    if comment_thread is not None:
+        comment_thread.join()
+    if not law_clauses:
+        return None
+    if complete is not None and not complete():
+        print(f"Law context stream for '{law_name}' was incomplete, not saving a law pack.")
         return None
 
+    if pack is not None and pack['clauses'] == law_clauses:
+        return pack
+    # The encoder is not needed: every clause vector is already here
+    build_law_pack(law_name, law_clauses, None, get_linker_model_id(), embeddings=np.vstack(clause_vectors))
+    return get_law_pack(law_name)
+
+def get_clause_vectors(law_name=None):
+    """
+    Returns (clause_ids, clause_vectors).
+    With a law_name, the precomputed law pack is used (built from law_context.json if missing).
+    """
+    if law_name:
+        pack = get_law_pack(law_name)
+        if pack is None:
+            law_clauses = load_law_context()
+            if not law_clauses:
+                return None, None
+            pack = ensure_law_pack(law_name, law_clauses)
+        return [c['clause_id'] for c in pack['clauses']], pack['embeddings']
+
+    law_clauses = load_law_context()
+    if not law_clauses:
+        return None, None
     clause_summaries = [c['summary'] for c in law_clauses]
-    clause_ids = [c['clause_id'] for c in law_clauses]
-    clause_vectors = linker_model.encode(clause_summaries, normalize_embeddings=True)
-    
+    clause_vectors = get_linker_model().encode(clause_summaries, normalize_embeddings=True)
+    return [c['clause_id'] for c in law_clauses], clause_vectors
+
+def assign_clauses(similarity_matrix, threshold=RELEVANCE_THRESHOLD):
+    """
+    Whole-array best-clause assignment.
+    Returns (clause_codes, best_scores); a code of -1 means Irrelevant.
+    """
+    best_idx = similarity_matrix.argmax(axis=1)
+    best_scores = np.take_along_axis(similarity_matrix, best_idx[:, None], axis=1)[:, 0]
+    clause_codes = np.where(best_scores < threshold, -1, best_idx)
+    return clause_codes, best_scores
+
+def top_k_clauses(similarity_matrix, k):
+    """Returns (clause_idx, scores) of the k best clauses per comment, best first."""
+    k = min(k, similarity_matrix.shape[1])
+    top_idx = np.argpartition(-similarity_matrix, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(similarity_matrix, top_idx, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_idx, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+def explode_top_clauses(df):
+    """One row per (comment, linked clause), so multi-section comments count against each section."""
+    exploded = df.explode(['Top_Clauses', 'Top_Scores'])
+    exploded = exploded.dropna(subset=['Top_Clauses'])
+    return exploded.rename(columns={'Top_Clauses': 'Clause', 'Top_Scores': 'Clause_Score'})
+
+def link_comments_to_law(input_df, law_name=None, top_k=1, chunk_size=None, score_dtype=np.float32, dedup="casefold"):
+    """
+    Input: A Pandas DataFrame containing a 'Comment' column.
+    Output: The same DataFrame with new columns added.
+    With top_k > 1, 'Top_Clauses' / 'Top_Scores' also list every clause among the
+    k best that clears the relevance threshold.
+    With chunk_size, comments are encoded and scored chunk by chunk and only the
+    per-comment reductions are kept, so peak memory follows the chunk size.
+    score_dtype=np.float16 halves the memory of the scoring step.
+    Duplicate comments (see src.dedup) are encoded and scored once and fanned
+    back out to every row; dedup=None disables this.
+    """
+    clause_ids, clause_vectors = get_clause_vectors(law_name)
+    if not clause_ids:
+        return None
+
     print(f"Vectorizing {len(input_df)} user comments...") 
     if 'Comment' not in input_df.columns:
         print("Error: Your CSV must have a column named 'Comment'")
         return None
 
     comments_list = input_df['Comment'].tolist()
-    comment_vectors = linker_model.encode(comments_list, batch_size=64, normalize_embeddings=True, show_progress_bar=True)
-    
+    inverse = None
+    if dedup:
+        comments_list, inverse = collapse_duplicates(comments_list, dedup)
+        print(f"Collapsed {len(input_df)} comments to {len(comments_list)} unique texts.")
+    n_comments = len(comments_list)
+    chunk_size = chunk_size or max(n_comments, 1)
+    clause_matrix_t = np.asarray(clause_vectors, dtype=score_dtype).T
+
+    clause_codes = np.empty(n_comments, dtype=np.int64)
+    best_scores = np.empty(n_comments, dtype=np.float32)
+    if top_k > 1:
+        top_k = min(top_k, len(clause_ids))
+        top_idx = np.empty((n_comments, top_k), dtype=np.int64)
+        top_scores = np.empty((n_comments, top_k), dtype=np.float32)
+
     print("Running Matrix Multiplication...")
-    similarity_matrix = np.matmul(comment_vectors, clause_vectors.T)
-    
-    linked_clauses = []
-    confidence_scores = []
-    
-    for i in range(len(comments_list)):
-        best_match_idx = similarity_matrix[i].argmax()
-        best_score = similarity_matrix[i][best_match_idx]
-        
-        if best_score < 0.25:
-            linked_clauses.append("Irrelevant")
-        else:
-            linked_clauses.append(clause_ids[best_match_idx])
-            
-        confidence_scores.append(round(float(best_score), 2))
-        
-    input_df['Linked_Clause'] = linked_clauses
-    input_df['Match_Confidence'] = confidence_scores
+    for start in range(0, n_comments, chunk_size):
+        end = min(start + chunk_size, n_comments)
+        comment_vectors = encode_comments(comments_list[start:end], flush=False).astype(score_dtype, copy=False)
+        similarity_matrix = np.matmul(comment_vectors, clause_matrix_t)
+
+        clause_codes[start:end], best_scores[start:end] = assign_clauses(similarity_matrix)
+        if top_k > 1:
+            top_idx[start:end], top_scores[start:end] = top_k_clauses(similarity_matrix, top_k)
+    get_embedding_cache().flush()
+
+    if inverse is not None:
+        clause_codes, best_scores = clause_codes[inverse], best_scores[inverse]
+        if top_k > 1:
+            top_idx, top_scores = top_idx[inverse], top_scores[inverse]
+
+    # Last label is what code -1 indexes into
+    clause_labels = np.array(list(clause_ids) + [IRRELEVANT], dtype=object)
+
+    input_df['Linked_Clause'] = clause_labels[clause_codes]
+    input_df['Match_Confidence'] = np.round(best_scores.astype(np.float64), 2)
+
+    if top_k > 1:
+        keep = top_scores >= RELEVANCE_THRESHOLD
+        top_scores = np.round(top_scores.astype(np.float64), 2)
+        input_df['Top_Clauses'] = [clause_labels[idx[m]].tolist() for idx, m in zip(top_idx, keep)]
+        input_df['Top_Scores'] = [scores[m].tolist() for scores, m in zip(top_scores, keep)]
 
     return input_df
 
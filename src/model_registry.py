@@ -0,0 +1,36 @@
+import functools
+import threading
+
+_resources = {}
+_registry_lock = threading.Lock()
+_key_locks = {}
+
+
+def cache_resource(func):
+    """
+    Process-wide memoization for models and other heavy resources, keyed by the
+    call arguments. A framework-neutral stand-in for st.cache_resource: Streamlit
+    sessions share imported modules, so the app still gets one copy per server
+    process, and the CLI gets the same caching without importing Streamlit.
+    Concurrent first calls for the same key wait for a single load.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+        if key in _resources:
+            return _resources[key]
+        with _registry_lock:
+            key_lock = _key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in _resources:
+                _resources[key] = func(*args, **kwargs)
+        return _resources[key]
+
+    def clear():
+        with _registry_lock:
+            for key in [k for k in _resources if k[:2] == (func.__module__, func.__qualname__)]:
+                del _resources[key]
+
+    wrapper.clear = clear
+    return wrapper
+
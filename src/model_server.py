@@ -0,0 +1,215 @@
+import argparse
+import base64
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Set e.g. POLICYIQ_MODEL_SERVER=http://127.0.0.1:8765 to route all MiniLM / RoBERTa
+# inference through a running sidecar instead of loading the models in-process.
+# Client and server should run with the same POLICYIQ_BACKEND.
+MODEL_SERVER_URL = os.getenv("POLICYIQ_MODEL_SERVER")
+DEFAULT_PORT = 8765
+# A merged batch is dispatched once it holds this many texts or the oldest request
+# has waited MAX_WAIT_MS, whichever comes first
+MAX_BATCH_TEXTS = 256
+MAX_WAIT_MS = 20
+# Clients send at most this many texts per request, so a large miss list never
+# turns into one huge response; a server that stops answering fails the call
+CLIENT_CHUNK_TEXTS = MAX_BATCH_TEXTS
+REQUEST_TIMEOUT_S = 300
+
+
+def _pack_array(array):
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return {"shape": list(array.shape), "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def _unpack_array(payload):
+    return np.frombuffer(base64.b64decode(payload["data"]), dtype=np.float32).reshape(payload["shape"]).copy()
+
+
+class DynamicBatcher:
+    """
+    Merges concurrent requests into shared batches. Each request blocks until the
+    batch it was merged into has run, then receives its own slice of the result.
+    """
+
+    def __init__(self, run_batch, max_batch_texts=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"batches": 0, "requests": 0, "texts": 0}
+        self._requests = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts):
+        request = {"texts": texts, "done": threading.Event()}
+        self._requests.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def _collect(self):
+        pending = [self._requests.get()]
+        n_texts = len(pending[0]["texts"])
+        deadline = time.monotonic() + self.max_wait
+        while n_texts < self.max_batch_texts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(request)
+            n_texts += len(request["texts"])
+        return pending
+
+    def _loop(self):
+        while True:
+            pending = self._collect()
+            texts = [t for request in pending for t in request["texts"]]
+            try:
+                result = self.run_batch(texts)
+                offset = 0
+                for request in pending:
+                    request["result"] = result[offset : offset + len(request["texts"])]
+                    offset += len(request["texts"])
+            except Exception as e:
+                for request in pending:
+                    request["error"] = e
+
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(pending)
+            self.stats["texts"] += len(texts)
+            for request in pending:
+                request["done"].set()
+
+
+def _make_handler(info, batchers):
+    class ModelRequestHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/info":
+                self._reply(200, info)
+            elif self.path == "/stats":
+                self._reply(200, {name: batcher.stats for name, batcher in batchers.items()})
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            name = self.path.strip("/")
+            if name not in batchers:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+                result = batchers[name].submit(texts)
+                self._reply(200, _pack_array(result))
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ModelRequestHandler
+
+
+def serve(port=DEFAULT_PORT):
+    """Loads MiniLM and RoBERTa once and serves /encode and /sentiment on localhost."""
+    from src.backends import INFERENCE_BACKEND, load_sentence_model, load_sequence_classifier
+    from src.linker import LINKER_MODEL_NAME, LINKER_MODEL_ID
+    from src.sentiment_engine import MODEL_NAME, configure_torch_threads, run_sentiment_model, sentiment_model_key
+
+    print(f"Loading models for the model server ({INFERENCE_BACKEND})...")
+    configure_torch_threads()
+    linker_model = load_sentence_model(LINKER_MODEL_NAME, INFERENCE_BACKEND)
+    tokenizer, sentiment_model = load_sequence_classifier(MODEL_NAME, INFERENCE_BACKEND)
+
+    def encode_batch(texts):
+        return linker_model.encode(texts, batch_size=64, normalize_embeddings=True)
+
+    def sentiment_batch(texts):
+        probs, _ = run_sentiment_model(texts, tokenizer, sentiment_model)
+        return probs
+
+    info = {
+        "linker": {"model_id": LINKER_MODEL_ID, "dim": linker_model.get_sentence_embedding_dimension()},
+        "sentiment": {"model_key": sentiment_model_key(sentiment_model), "id2label": sentiment_model.config.id2label},
+    }
+    batchers = {"encode": DynamicBatcher(encode_batch), "sentiment": DynamicBatcher(sentiment_batch)}
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(info, batchers))
+    print(f"Model server listening on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+def _request(path, payload=None):
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(
+        MODEL_SERVER_URL.rstrip("/") + path, data=data, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_S) as response:
+        return json.loads(response.read())
+
+
+_info = None
+
+
+def server_info():
+    global _info
+    if _info is None:
+        _info = _request("/info")
+        id2label = _info["sentiment"]["id2label"]
+        # JSON turns the integer label ids into strings
+        _info["sentiment"]["id2label"] = {int(k): v for k, v in id2label.items()}
+    return _info
+
+
+def _request_in_chunks(path, texts):
+    texts = list(texts)
+    # An empty list still makes one request, so the result keeps the server's column count
+    starts = range(0, len(texts), CLIENT_CHUNK_TEXTS) or [0]
+    chunks = [_unpack_array(_request(path, {"texts": texts[i : i + CLIENT_CHUNK_TEXTS]})) for i in starts]
+    return np.concatenate(chunks)
+
+
+def remote_encode(texts):
+    return _request_in_chunks("/encode", texts)
+
+
+def remote_sentiment_probs(texts):
+    return _request_in_chunks("/sentiment", texts)
+
+
+class RemoteEncoder:
+    """Stands in for a SentenceTransformer; embeddings always come back normalized."""
+
+    def encode(self, sentences, **kwargs):
+        if not kwargs.get("normalize_embeddings", False):
+            raise ValueError("The model server only returns normalized embeddings.")
+        return remote_encode(sentences)
+
+    def get_sentence_embedding_dimension(self):
+        return server_info()["linker"]["dim"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared MiniLM / RoBERTa inference server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve(args.port)
@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import pandas as pd
+from src.law_pack import temp_path
+
+RESULT_PATH = os.path.join("data", "processed", "final_analysis_result.parquet")
+CATEGORICAL_COLUMNS = ['Linked_Clause', 'Sentiment_Label']
+FLOAT32_COLUMNS = ['Match_Confidence', 'Sentiment_Score']
+# Per-label probability columns written by analyze_sentiment(keep_probs=True)
+PROB_PREFIX = "Prob_"
+
+
+def compact_results(df):
+    """
+    Clause and label as categoricals, scores and probabilities as float32.
+    Returns a new frame; columns that aren't there are skipped.
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in FLOAT32_COLUMNS + [c for c in df.columns if str(c).startswith(PROB_PREFIX)]:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def save_results(df, path=RESULT_PATH):
+    """Writes the result frame to Parquet (needs pyarrow); categoricals are stored dictionary-encoded."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    compact_results(df).to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_results(path=RESULT_PATH, columns=None):
+    """Reads a result file; a Parquet result comes back with categoricals and float32 scores intact."""
+    if path.endswith(".csv"):
+        return compact_results(pd.read_csv(path, usecols=columns))
+    return pd.read_parquet(path, engine="pyarrow", columns=columns)
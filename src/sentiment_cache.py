@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+
+CACHE_PATH = os.path.join("data", "cache", "sentiment.sqlite")
+# SQLite's default limit on bound parameters is 999
+LOOKUP_CHUNK = 500
+
+
+def result_key(text):
+    # RoBERTa is case- and whitespace-sensitive, so the text is hashed as-is
+    return hashlib.blake2b(str(text).encode("utf-8"), digest_size=16).digest()
+
+
+class SentimentCache:
+    """
+    Durable map of (model key, text hash) -> full probability vector.
+    Each model key (model + backend @ revision) keeps its own rows, so switching
+    backends and back reuses what was stored; opening the cache with a new
+    revision of a model drops that model's older revisions only.
+    """
+
+    def __init__(self, model_key, num_labels, path=CACHE_PATH):
+        self.model_key = model_key
+        self.num_labels = num_labels
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_results ("
+            "model_key TEXT NOT NULL, key BLOB NOT NULL, probs BLOB NOT NULL, PRIMARY KEY (model_key, key))"
+        )
+        self._migrate_single_model_table()
+
+        model_prefix = model_key.rsplit("@", 1)[0] + "@"
+        stale = self._conn.execute(
+            "DELETE FROM model_results WHERE substr(model_key, 1, ?) = ? AND model_key != ?",
+            (len(model_prefix), model_prefix, model_key),
+        ).rowcount
+        if stale:
+            print(f"Sentiment model revision changed, dropped {stale} cached results of older revisions.")
+        self._conn.commit()
+
+    def _migrate_single_model_table(self):
+        # Older caches held one model's rows in `results`, with its key in `meta`
+        has_legacy = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'results'"
+        ).fetchone()
+        if not has_legacy:
+            return
+        # Both tables were always created together
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'model_key'").fetchone()
+        if row is not None:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO model_results (model_key, key, probs) SELECT ?, key, probs FROM results", (row[0],)
+            )
+        self._conn.execute("DROP TABLE results")
+        self._conn.execute("DROP TABLE IF EXISTS meta")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Returns (probs, hit_mask). Rows for misses are left as zeros."""
+        probs = np.zeros((len(keys), self.num_labels), dtype=np.float32)
+        hits = np.zeros(len(keys), dtype=bool)
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+
+        unique_keys = list(positions)
+        with self._lock:
+            for start in range(0, len(unique_keys), LOOKUP_CHUNK):
+                chunk = unique_keys[start : start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, probs FROM model_results WHERE model_key = ? AND key IN ({placeholders})",
+                    [self.model_key] + chunk,
+                )
+                for key, blob in rows:
+                    rows_for_key = positions[key]
+                    probs[rows_for_key] = np.frombuffer(blob, dtype=np.float32)
+                    hits[rows_for_key] = True
+        return probs, hits
+
+    def put_many(self, keys, probs):
+        probs = np.asarray(probs, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO model_results (model_key, key, probs) VALUES (?, ?, ?)",
+                ((self.model_key, key, row.tobytes()) for key, row in zip(keys, probs)),
+            )
+            self._conn.commit()
@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from scipy.special import softmax
+from src.linker import encode_comments
+from src.sentiment_engine import predict_sentiment_probs
+
+# Comments whose linear-head confidence is below this go on to RoBERTa
+CASCADE_CONFIDENCE = 0.90
+# RoBERTa-labelled sample the linear head is distilled from
+CALIBRATION_SIZE = 512
+HOLDOUT_FRACTION = 0.2
+
+
+def fit_linear_head(embeddings, target_probs, epochs=300, lr=2.0, l2=1e-4):
+    """Softmax regression on soft RoBERTa targets, full-batch gradient descent."""
+    n, dim = embeddings.shape
+    weights = np.zeros((dim, target_probs.shape[1]), dtype=np.float32)
+    bias = np.zeros(target_probs.shape[1], dtype=np.float32)
+    for _ in range(epochs):
+        grad = (softmax(embeddings @ weights + bias, axis=1) - target_probs) / n
+        weights -= lr * (embeddings.T @ grad + l2 * weights)
+        bias -= lr * grad.sum(axis=0)
+    return weights, bias
+
+
+def run_cascade(texts, threshold=None, compare_full=False, seed=0):
+    """
+    Two-tier sentiment: a linear head over the (cached) MiniLM embeddings labels every
+    text, and only texts below `threshold` confidence are re-scored by RoBERTa.
+    Returns (probs, id2label) like predict_sentiment_probs and prints a tier report.
+    With compare_full, RoBERTa also scores everything to measure exact agreement.
+    """
+    threshold = CASCADE_CONFIDENCE if threshold is None else threshold
+    n_texts = len(texts)
+    start = time.perf_counter()
+
+    # Embeddings were computed by the linker, so this is almost all cache hits
+    embeddings = encode_comments(texts)
+
+    rng = np.random.default_rng(seed)
+    sample_idx = rng.permutation(n_texts)[:min(CALIBRATION_SIZE, n_texts)]
+    sample_probs, id2label = predict_sentiment_probs([texts[i] for i in sample_idx])
+    n_holdout = int(len(sample_idx) * HOLDOUT_FRACTION)
+    train_idx, holdout_idx = sample_idx[n_holdout:], sample_idx[:n_holdout]
+
+    weights, bias = fit_linear_head(embeddings[train_idx], sample_probs[n_holdout:])
+    head_start = time.perf_counter()
+    probs = softmax(embeddings @ weights + bias, axis=1).astype(np.float32)
+    head_seconds = time.perf_counter() - head_start
+
+    # RoBERTa already scored the calibration sample; keep its answers
+    probs[sample_idx] = sample_probs
+    needs_roberta = probs.max(axis=1) < threshold
+    needs_roberta[sample_idx] = False
+    uncertain_idx = np.flatnonzero(needs_roberta)
+
+    roberta_start = time.perf_counter()
+    if len(uncertain_idx):
+        probs[uncertain_idx], _ = predict_sentiment_probs([texts[i] for i in uncertain_idx])
+    roberta_seconds = time.perf_counter() - roberta_start
+    total_seconds = time.perf_counter() - start
+
+    n_head = n_texts - len(sample_idx) - len(uncertain_idx)
+    print("\nSENTIMENT CASCADE REPORT")
+    print(f"   • Threshold: {threshold}")
+    print(f"   • Linear head only: {n_head} ({n_head / n_texts:.1%})")
+    print(f"   • RoBERTa (uncertain): {len(uncertain_idx)} ({len(uncertain_idx) / n_texts:.1%})")
+    print(f"   • RoBERTa (calibration): {len(sample_idx)}")
+    print(f"   • Throughput: {n_texts / total_seconds:.1f} comments/s "
+          f"(head {head_seconds:.2f}s, RoBERTa {roberta_seconds:.2f}s)")
+
+    if n_holdout:
+        # Holdout rows were never seen by the head; simulate the cascade on them
+        holdout_head = softmax(embeddings[holdout_idx] @ weights + bias, axis=1)
+        holdout_true = sample_probs[:n_holdout].argmax(axis=1)
+        confident = holdout_head.max(axis=1) >= threshold
+        cascade_pred = np.where(confident, holdout_head.argmax(axis=1), holdout_true)
+        print(f"   • Est. agreement with full RoBERTa (holdout of {n_holdout}): "
+              f"{(cascade_pred == holdout_true).mean():.2%}, "
+              f"head alone {(holdout_head.argmax(axis=1) == holdout_true).mean():.2%}")
+
+    if compare_full:
+        full_probs, _ = predict_sentiment_probs(texts)
+        agreement = (full_probs.argmax(axis=1) == probs.argmax(axis=1)).mean()
+        print(f"   • Agreement with full RoBERTa run: {agreement:.2%}")
+
+    return probs, id2label
@@ -1,26 +1,187 @@
+import os
+import queue
+import threading
 import pandas as pd
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from tqdm import tqdm
-import streamlit as st
 import numpy as np
-from scipy.special import softmax
+from src.backends import INFERENCE_BACKEND, load_sequence_classifier, model_id
+from src.dedup import collapse_duplicates
+from src.linker import explode_top_clauses
+from src.model_registry import cache_resource
+from src.model_server import MODEL_SERVER_URL, remote_sentiment_probs, server_info
+from src.sentiment_cache import SentimentCache, result_key
 
 
 MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
 BATCH_SIZE = 32
+MAX_LENGTH = 128
+# Padded-token budget per batch (BATCH_SIZE full-length comments)
+MAX_BATCH_TOKENS = BATCH_SIZE * MAX_LENGTH
+# Texts tokenized per step by the background tokenizer thread; batches are
+# length-bucketed within each chunk
+TOKENIZE_CHUNK = 2048
+# Ready batches the tokenizer may run ahead of inference
+PREFETCH_BATCHES = 4
+# Leave one core to the tokenizer thread
+TORCH_THREADS = int(os.getenv("POLICYIQ_TORCH_THREADS", max(1, (os.cpu_count() or 2) - 1)))
+TORCH_INTEROP_THREADS = 1
 
-@st.cache_resource
-def get_sentiment_model():
-    print(f"Loading Sentiment Model ({MODEL_NAME}) into RAM...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+def configure_torch_threads():
+    import torch
+    torch.set_num_threads(TORCH_THREADS)
+    try:
+        torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+    except RuntimeError:
+        # Can only be set once, before any inter-op parallel work has started
+        pass
+
+@cache_resource
+def get_sentiment_model(backend=INFERENCE_BACKEND):
+    print(f"Loading Sentiment Model ({MODEL_NAME}, {backend}) into RAM...")
+    import torch
+    configure_torch_threads()
+    tokenizer, model = load_sequence_classifier(MODEL_NAME, backend)
     device = torch.device("cpu")
-    model.to(device)
-    model.eval()
     return tokenizer, model, device
 
-def analyze_sentiment(df):
+def make_length_batches(lengths, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Groups row indices of similar token length so each batch pads to at most
+    max_batch_tokens tokens in total (longest member x batch size).
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    current = []
+    for idx in order:
+        # Sorted ascending, so this row is the longest in the batch so far
+        if current and lengths[idx] * (len(current) + 1) > max_batch_tokens:
+            batches.append(current)
+            current = []
+        current.append(int(idx))
+    if current:
+        batches.append(current)
+    return batches
+
+def _tokenize_batches(tokenizer, texts, ready_batches):
+    """
+    Producer: tokenizes texts chunk by chunk and puts (row_indices, padded_inputs)
+    on the queue, then None. Errors are put on the queue for the consumer to raise.
+    """
+    try:
+        for chunk_start in range(0, len(texts), TOKENIZE_CHUNK):
+            encodings = tokenizer(texts[chunk_start : chunk_start + TOKENIZE_CHUNK], truncation=True, max_length=MAX_LENGTH)
+            lengths = np.array([len(ids) for ids in encodings['input_ids']])
+            # Batch by length so short comments don't pay for the padding of long ones
+            for batch_idx in make_length_batches(lengths):
+                inputs = tokenizer.pad(
+                    {key: [encodings[key][i] for i in batch_idx] for key in encodings.keys()},
+                    return_tensors="pt"
+                )
+                ready_batches.put((chunk_start + np.asarray(batch_idx), inputs))
+        ready_batches.put(None)
+    except Exception as e:
+        ready_batches.put(e)
+
+def sentiment_model_key(model):
+    # Revision pins the exact weights; changing MODEL_NAME, backend or revision invalidates the cache
+    revision = getattr(model.config, "_commit_hash", None) or "unknown"
+    return f"{model_id(MODEL_NAME, INFERENCE_BACKEND)}@{revision}"
+
+def get_sentiment_info():
+    """Returns (model_key, id2label) without loading the model locally when a model server is used."""
+    if MODEL_SERVER_URL:
+        info = server_info()["sentiment"]
+        return info["model_key"], info["id2label"]
+    _, model, _ = get_sentiment_model()
+    return sentiment_model_key(model), model.config.id2label
+
+@cache_resource
+def get_sentiment_cache():
+    model_key, id2label = get_sentiment_info()
+    return SentimentCache(model_key, len(id2label))
+
+def run_sentiment_model(texts, tokenizer=None, model=None):
+    """
+    Runs RoBERTa over texts in length-bucketed batches.
+    Tokenization runs in a background thread, overlapping with inference.
+    Uses the model server when one is configured, unless a tokenizer/model is given.
+    Returns (probs, id2label) with probs of shape (len(texts), num_labels) in input order.
+    """
+    import torch
+    from scipy.special import softmax
+
+    device = torch.device("cpu")
+    if model is None:
+        if MODEL_SERVER_URL:
+            _, id2label = get_sentiment_info()
+            return remote_sentiment_probs(texts), id2label
+        tokenizer, model, device = get_sentiment_model()
+    id2label = model.config.id2label
+    logits = np.zeros((len(texts), len(id2label)), dtype=np.float32)
+    if not texts:
+        return logits, id2label
+
+    ready_batches = queue.Queue(maxsize=PREFETCH_BATCHES)
+    producer = threading.Thread(target=_tokenize_batches, args=(tokenizer, texts, ready_batches), daemon=True)
+    producer.start()
+
+    print("Starting Batch Analysis")
+    
+    # tqdm creates the progress bar
+    with tqdm(total=len(texts), desc="Processing Batches", unit="comments") as progress:
+        while True:
+            item = ready_batches.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            batch_idx, inputs = item
+
+            # Inference No Gradients needed = Faster
+            with torch.no_grad():
+                outputs = model(**inputs.to(device))
+
+            # Back at the original positions
+            logits[batch_idx] = outputs.logits.detach().numpy()
+            progress.update(len(batch_idx))
+
+    producer.join()
+    # Post-processing in one vectorized step
+    return softmax(logits, axis=1), id2label
+
+def predict_sentiment_probs(texts, use_cache=True):
+    """
+    Like run_sentiment_model, but served from the persistent result cache where
+    possible; only misses are run through RoBERTa.
+    """
+    if not use_cache:
+        return run_sentiment_model(texts)
+
+    _, id2label = get_sentiment_info()
+    cache = get_sentiment_cache()
+    keys = [result_key(t) for t in texts]
+    probs, hits = cache.get_many(keys)
+
+    miss_idx = np.flatnonzero(~hits)
+    hit_rate = hits.mean() if len(hits) else 0.0
+    print(f"Sentiment cache: {int(hits.sum())}/{len(keys)} hits ({hit_rate:.1%}), scoring {len(miss_idx)} comments...")
+    if len(miss_idx):
+        miss_probs, _ = run_sentiment_model([texts[i] for i in miss_idx])
+        probs[miss_idx] = miss_probs
+        cache.put_many([keys[i] for i in miss_idx], miss_probs)
+
+    return probs, id2label
+
+def analyze_sentiment(df, dedup="exact", mode="full", cascade_threshold=None, keep_probs=False, compare_full=False):
+    """
+    Adds 'Sentiment_Label' / 'Sentiment_Score' for every comment linked to a clause.
+    keep_probs=True also keeps the full probability vector as float32
+    'Prob_<label>' columns (NaN for unlinked comments).
+    Duplicate comments are only run through RoBERTa once (dedup=None disables this).
+    mode="cascade" labels with a linear head over MiniLM embeddings first and only
+    sends comments below cascade_threshold confidence to RoBERTa; compare_full
+    also runs RoBERTa on everything and reports the cascade's agreement with it.
+    """
     if not isinstance(df, pd.DataFrame):
         print("Error: Input is not a pandas DataFrame.")
         return None
@@ -35,47 +196,41 @@ def analyze_sentiment(df):
     if not relevant_comments:
         print("No relevant comments found. Exiting.")
         return df
+
+    inverse = None
+    if dedup:
+        n_relevant = len(relevant_comments)
+        relevant_comments, inverse = collapse_duplicates(relevant_comments, dedup)
+        print(f"Collapsed {n_relevant} relevant comments to {len(relevant_comments)} unique texts.")
     
     df['Sentiment_Label'] = "N/A"
     df['Sentiment_Score'] = 0.0
 
-    tokenizer, model, device = get_sentiment_model()
+    if mode == "cascade":
+        from src.sentiment_cascade import run_cascade
+        probs, id2label = run_cascade(relevant_comments, threshold=cascade_threshold, compare_full=compare_full)
+    else:
+        probs, id2label = predict_sentiment_probs(relevant_comments)
 
-    id2label = model.config.id2label 
-    processed_labels = []
-    processed_scores = []
+    top_ids = probs.argmax(axis=1)
+    label_names = np.array([id2label[i] for i in range(probs.shape[1])], dtype=object)
+    processed_labels = label_names[top_ids]
+    processed_scores = np.round(probs[np.arange(len(top_ids)), top_ids].astype(np.float64), 4)
 
-    print("Starting Batch Analysis")
-    
-    # tqdm creates the progress bar
-    for i in tqdm(range(0, len(relevant_comments), BATCH_SIZE), desc="Processing Batches"):
-        batch_texts = relevant_comments[i : i + BATCH_SIZE]
-        
-        # Tokenize
-        inputs = tokenizer(
-            batch_texts, 
-            padding=True, 
-            truncation=True, 
-            max_length=128, 
-            return_tensors="pt"
-        ).to(device)
-        
-        # Inference No Gradients needed = Faster
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        # Post-processing
-        logits = outputs.logits.detach().numpy()
-        probs = softmax(logits, axis=1)
-        
-        # Extract best label for each in batch
-        for j in range(len(probs)):
-            top_id = np.argmax(probs[j])
-            processed_labels.append(id2label[top_id])
-            processed_scores.append(round(float(probs[j][top_id]), 4))
+    if inverse is not None:
+        processed_labels = processed_labels[inverse]
+        processed_scores = processed_scores[inverse]
+        probs = probs[inverse]
 
     df.loc[relevant_mask, 'Sentiment_Label'] = processed_labels
     df.loc[relevant_mask, 'Sentiment_Score'] = processed_scores
+
+    if keep_probs:
+        relevant_rows = np.flatnonzero(relevant_mask.to_numpy())
+        for i, name in enumerate(label_names):
+            column = np.full(len(df), np.nan, dtype=np.float32)
+            column[relevant_rows] = probs[:, i]
+            df[f'Prob_{name}'] = column
     
     return df
 
@@ -88,8 +243,15 @@ def generate_final_report(df):
     if relevant_df.empty:
         return
 
+    # With top-k linking, a comment counts against every section it touches
+    clause_col = 'Linked_Clause'
+    if 'Top_Clauses' in relevant_df.columns:
+        relevant_df = explode_top_clauses(relevant_df)
+        clause_col = 'Clause'
+        print("(Counting each comment against all of its linked sections)")
+
     # Pivot Table: Clauses vs Sentiments
-    summary = relevant_df.groupby(['Linked_Clause', 'Sentiment_Label']).size().unstack(fill_value=0)
+    summary = relevant_df.groupby([clause_col, 'Sentiment_Label'], observed=True).size().unstack(fill_value=0)
     
     # Ensure all columns exist (Negative, Neutral, Positive)
     for col in ['negative', 'neutral', 'positive']:
@@ -0,0 +1,143 @@
+import os
+import random
+import time
+import pandas as pd
+from src.insight_engine import get_groq_insight, log_token_savings, select_insight_comments
+from src.law_fetcher import store_law_summary
+from src.linker import IRRELEVANT, link_comments_to_law
+from src.sentiment_engine import analyze_sentiment
+
+STREAM_CHUNK_ROWS = 5000
+# Comments kept per clause/sentiment pair for the insight step
+RESERVOIR_SIZE = 200
+STREAM_OUTPUT_PATH = os.path.join("data", "processed", "final_analysis_result.csv")
+RESERVOIR_COLUMNS = ['Comment', 'Linked_Clause', 'Sentiment_Label', 'Match_Confidence', 'Sentiment_Score']
+
+
+def iter_comment_chunks(csv_path, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yields the input CSV as DataFrames of at most chunk_rows rows."""
+    with pd.read_csv(csv_path, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+class StreamingAggregates:
+    """
+    Running clause x sentiment counts plus a uniform reservoir sample of the
+    comments in each pair, so the insight step never needs the full result.
+    """
+
+    def __init__(self, reservoir_size=RESERVOIR_SIZE, seed=0):
+        self.reservoir_size = reservoir_size
+        self.rows = 0
+        self.counts = {}
+        self.reservoirs = {}
+        self._rng = random.Random(seed)
+
+    def update(self, chunk_df):
+        self.rows += len(chunk_df)
+        labelled = chunk_df[(chunk_df['Sentiment_Label'] != "N/A") & (chunk_df['Linked_Clause'] != IRRELEVANT)]
+        for record in labelled[RESERVOIR_COLUMNS].itertuples(index=False, name=None):
+            pair = (record[1], record[2])
+            seen = self.counts.get(pair, 0) + 1
+            self.counts[pair] = seen
+            reservoir = self.reservoirs.setdefault(pair, [])
+            # Algorithm R: the n-th item replaces a random slot with probability size/n
+            if len(reservoir) < self.reservoir_size:
+                reservoir.append(record)
+            else:
+                slot = self._rng.randrange(seen)
+                if slot < self.reservoir_size:
+                    reservoir[slot] = record
+
+    def summary(self):
+        """Same shape as df.groupby(['Linked_Clause', 'Sentiment_Label']).size().unstack(fill_value=0)."""
+        if not self.counts:
+            return pd.DataFrame(columns=['negative', 'positive'])
+        counts = pd.Series(self.counts)
+        counts.index.names = ['Linked_Clause', 'Sentiment_Label']
+        summary = counts.unstack(fill_value=0)
+        for col in ['negative', 'positive']:
+            if col not in summary.columns:
+                summary[col] = 0
+        return summary
+
+    def reservoir_frame(self):
+        records = [record for reservoir in self.reservoirs.values() for record in reservoir]
+        return pd.DataFrame(records, columns=RESERVOIR_COLUMNS)
+
+
+def stream_analysis(law_name, raw_csv_path, output_path=STREAM_OUTPUT_PATH, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Generator over (chunk_df, aggregates): each chunk is linked, scored and
+    appended to output_path before it is yielded, so the output file always
+    holds every finished chunk. Memory stays at one chunk plus the aggregates.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    aggregates = StreamingAggregates()
+    for i, chunk in enumerate(iter_comment_chunks(raw_csv_path, chunk_rows)):
+        start = time.perf_counter()
+        linked_df = link_comments_to_law(chunk, law_name)
+        if linked_df is None:
+            print(f"Error: Linking failed on chunk {i + 1}, stopping.")
+            return
+        final_df = analyze_sentiment(linked_df)
+        if 'Sentiment_Label' not in final_df.columns:
+            # analyze_sentiment leaves the columns off when nothing in the chunk was relevant
+            final_df['Sentiment_Label'] = "N/A"
+            final_df['Sentiment_Score'] = 0.0
+
+        final_df.to_csv(output_path, mode="a", header=(i == 0), index=False)
+        aggregates.update(final_df)
+        print(f"Chunk {i + 1}: {len(final_df)} comments in {time.perf_counter() - start:.1f}s "
+              f"({aggregates.rows} so far)")
+        yield final_df, aggregates
+
+
+def streamed_insights(aggregates, law_name):
+    """The opposed / supported insights, from exact counts and the reservoir sample."""
+    summary = aggregates.summary()
+    sample = aggregates.reservoir_frame()
+    insights = {}
+    token_stats = {}
+    if summary['negative'].sum() > 0:
+        section = summary['negative'].idxmax()
+        insights['opposed_sec'] = section
+        insights['opposed_text'] = get_groq_insight(
+            select_insight_comments(sample, section, 'negative', token_stats), law_name, section, "negative"
+        )
+    if summary['positive'].sum() > 0:
+        section = summary['positive'].idxmax()
+        insights['supported_sec'] = section
+        insights['supported_text'] = get_groq_insight(
+            select_insight_comments(sample, section, 'positive', token_stats), law_name, section, "positive"
+        )
+    log_token_savings(token_stats)
+    return insights
+
+
+def run_streaming_pipeline(law_name, raw_csv_path, output_path=STREAM_OUTPUT_PATH, chunk_rows=STREAM_CHUNK_ROWS):
+    if not os.path.exists(raw_csv_path):
+        return f"Error: Could not find input file at {raw_csv_path}"
+
+    print("\n[1/3] Fetching law summary...")
+    if not store_law_summary(law_name):
+        return "Pipeline Failed: No law context."
+
+    print(f"\n[2/3] Linking and scoring in chunks of {chunk_rows} rows...")
+    aggregates = None
+    for _, aggregates in stream_analysis(law_name, raw_csv_path, output_path, chunk_rows):
+        pass
+    if aggregates is None:
+        return "Pipeline Failed: No chunks were processed."
+    print(f"Final data saved to {output_path}")
+
+    print("\n[3/3] Generating insights...")
+    insights = streamed_insights(aggregates, law_name)
+    for key in ('opposed', 'supported'):
+        if f'{key}_sec' in insights:
+            print(f"   • Most {key}: {insights[f'{key}_sec']} — {insights[f'{key}_text']}")
+    return "Pipeline Completed Successfully!"
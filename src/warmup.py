@@ -0,0 +1,61 @@
+import threading
+import time
+
+_state = {"status": "idle", "error": None, "timings": {}}
+_lock = threading.Lock()
+_thread = None
+_started_at = None
+
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    _state["timings"][name] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def _warm_models():
+    from src.linker import get_linker_model
+    from src.sentiment_engine import run_sentiment_model
+
+    try:
+        linker_model = _timed("linker_load_s", get_linker_model)
+        # Dummy passes trigger lazy kernel / graph initialisation
+        _timed("linker_first_pass_s", lambda: linker_model.encode(["warm-up"], normalize_embeddings=True))
+        _timed("sentiment_load_and_first_pass_s", lambda: run_sentiment_model(["warm-up"]))
+        _state["timings"]["cold_start_s"] = round(time.perf_counter() - _started_at, 2)
+        _state["status"] = "ready"
+        print(f"Models warm: {_state['timings']}")
+    except Exception as e:
+        _state["status"] = "failed"
+        _state["error"] = str(e)
+        print(f"Model warm-up failed: {e}")
+
+
+def start_warmup():
+    """Starts loading and warming MiniLM and RoBERTa in a background thread (once per process)."""
+    global _thread, _started_at
+    with _lock:
+        if _thread is not None:
+            return
+        _started_at = time.perf_counter()
+        _state["status"] = "warming"
+        _thread = threading.Thread(target=_warm_models, name="model-warmup", daemon=True)
+        _thread.start()
+
+
+def wait_until_ready(timeout=None):
+    if _thread is not None:
+        _thread.join(timeout)
+    return _state["status"] == "ready"
+
+
+def record_request_latency(seconds):
+    """The first call is kept as the first-request latency, which is what warm-up should shrink."""
+    _state["timings"].setdefault("first_request_s", round(seconds, 2))
+    _state["timings"]["last_request_s"] = round(seconds, 2)
+    print(f"Analysis request took {seconds:.2f}s (models {_state['status']} at start)")
+
+
+def warmup_status():
+    return {"status": _state["status"], "error": _state["error"], "timings": dict(_state["timings"])}